@@ -6,6 +6,7 @@ import click
 import yaml
 
 from servicecatalog_puppet import constants
+from servicecatalog_puppet import sessions
 from betterboto import client as betterboto_client
 
 logger = logging.getLogger(__file__)
@@ -394,7 +395,7 @@ def get_provisioning_artifact_id_for(portfolio_name, product_name, version_name,
         portfolio_name, product_name, version_name, region, account_id
     ))
     role = "arn:aws:iam::{}:role/{}".format(account_id, 'servicecatalog-puppet/PuppetRole')
-    with betterboto_client.CrossAccountClientContextManager(
+    with sessions.CrossAccountClientContextManager(
             'servicecatalog', role, "-".join([account_id, region]), region_name=region
     ) as cross_account_servicecatalog:
         product_id = None
@@ -441,7 +442,7 @@ def get_provisioning_artifact_id_for(portfolio_name, product_name, version_name,
 def get_portfolio_for(portfolio_name, account_id, region):
     logger.info(f"Getting portfolio id for: {portfolio_name}")
     role = f"arn:aws:iam::{account_id}:role/servicecatalog-puppet/PuppetRole"
-    with betterboto_client.CrossAccountClientContextManager(
+    with sessions.CrossAccountClientContextManager(
             'servicecatalog', role, "-".join([account_id, region]), region_name=region
     ) as cross_account_servicecatalog:
         portfolio = None
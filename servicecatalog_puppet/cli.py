@@ -4,6 +4,7 @@
 import click
 import yaml
 
+from servicecatalog_puppet import constants
 from servicecatalog_puppet import core
 
 
@@ -25,22 +26,53 @@ def generate_shares(f):
 @click.argument('f', type=click.File())
 @click.option('--single-account', default=None)
 @click.option('--num-workers', default=10)
-def deploy(f, single_account, num_workers):
-    core.deploy(f, single_account, num_workers)
+@click.option('--launch', default=None)
+@click.option('--region', default=None)
+@click.option('--tag', default=None)
+@click.option('--portfolio', default=None)
+@click.option('--since', default=None, type=click.File())
+@click.option('--num-compile-workers', default=None, type=int)
+@click.option(
+    '--execution-mode',
+    type=click.Choice([constants.EXECUTION_MODE_PROCESSES, constants.EXECUTION_MODE_THREADS]),
+    default=constants.EXECUTION_MODE_PROCESSES,
+)
+def deploy(f, single_account, num_workers, launch, region, tag, portfolio, since, num_compile_workers, execution_mode):
+    core.deploy(
+        f, single_account, num_workers, launch=launch, region=region, tag=tag, portfolio=portfolio, since=since,
+        num_compile_workers=num_compile_workers, execution_mode=execution_mode,
+    )
 
 
 @cli.command()
 @click.argument('f', type=click.File())
 @click.option('--single-account', default=None)
-def graph(f, single_account):
-    core.graph(f)
+@click.option('--launch', default=None)
+@click.option('--depth', default=None, type=int)
+@click.option('--format', '-f', type=click.Choice(['dot', 'json', 'graphml']), default='dot')
+def graph(f, single_account, launch, depth, format):
+    core.graph(f, format, launch, single_account, depth)
 
 
 @cli.command()
 @click.argument('f', type=click.File())
 @click.option('--single-account', default=None)
-def dry_run(f, single_account):
-    core.deploy(f, single_account, dry_run=True)
+@click.option('--launch', default=None)
+@click.option('--region', default=None)
+@click.option('--tag', default=None)
+@click.option('--portfolio', default=None)
+@click.option('--since', default=None, type=click.File())
+@click.option('--num-compile-workers', default=None, type=int)
+@click.option(
+    '--execution-mode',
+    type=click.Choice([constants.EXECUTION_MODE_PROCESSES, constants.EXECUTION_MODE_THREADS]),
+    default=constants.EXECUTION_MODE_PROCESSES,
+)
+def dry_run(f, single_account, launch, region, tag, portfolio, since, num_compile_workers, execution_mode):
+    core.deploy(
+        f, single_account, dry_run=True, launch=launch, region=region, tag=tag, portfolio=portfolio, since=since,
+        num_compile_workers=num_compile_workers, execution_mode=execution_mode,
+    )
 
 
 @cli.command()
@@ -96,8 +128,11 @@ def list_launches(expanded_manifest, format):
 
 @cli.command()
 @click.argument('f', type=click.File())
-def expand(f):
-    core.expand(f)
+@click.option('--org-snapshot', default=None, type=click.Path())
+@click.option('--org-snapshot-ttl', default=86400)
+@click.option('--json-sidecar/--no-json-sidecar', default=False)
+def expand(f, org_snapshot, org_snapshot_ttl, json_sidecar):
+    core.expand(f, org_snapshot, org_snapshot_ttl, json_sidecar)
 
 
 @cli.command()
@@ -15,6 +15,11 @@ HOME_REGION_PARAM_NAME = "/servicecatalog-puppet/home-region"
 PROVISIONED = 'provisioned'
 TERMINATED = 'terminated'
 
+DEPENDS_ON_SCOPE_SAME_ACCOUNT_SAME_REGION = 'same-account-same-region'
+DEPENDS_ON_SCOPE_SAME_ACCOUNT = 'same-account'
+DEPENDS_ON_SCOPE_GLOBAL = 'global'
+DEFAULT_DEPENDS_ON_SCOPE = DEPENDS_ON_SCOPE_SAME_ACCOUNT_SAME_REGION
+
 DEFAULT_TIMEOUT = 0
 LAUNCHES = 'launches'
 SPOKE_LOCAL_PORTFOLIOS = 'spoke-local-portfolios'
@@ -39,3 +44,6 @@ HOME_REGION = os.environ.get('AWS_REGION', os.environ.get('AWS_DEFAULT_REGION',
 
 
 EVENTBRIDGE_MAX_EVENTS_PER_CALL = 10
+
+EXECUTION_MODE_PROCESSES = 'processes'
+EXECUTION_MODE_THREADS = 'threads'
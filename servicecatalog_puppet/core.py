@@ -10,6 +10,7 @@ import terminaltables
 import shutil
 import json
 from threading import Thread
+from collections.abc import Mapping
 
 import pkg_resources
 import yaml
@@ -26,8 +27,12 @@ from servicecatalog_puppet.workflow import management as management_tasks
 from servicecatalog_puppet.workflow import portfoliomanagement as portfoliomanagement_tasks
 from servicecatalog_puppet.workflow import provisioning as provisioning_tasks
 from servicecatalog_puppet.workflow import runner as runner
+from servicecatalog_puppet.workflow import tasks as workflow_tasks
 from servicecatalog_puppet import config
 from servicecatalog_puppet import manifest_utils
+from servicecatalog_puppet import graph as graph_utils
+from servicecatalog_puppet import organizations
+from servicecatalog_puppet import sessions
 from servicecatalog_puppet import aws
 
 from servicecatalog_puppet import asset_helpers
@@ -55,9 +60,11 @@ def generate_shares(f):
     tasks_to_run = []
     puppet_account_id = config.get_puppet_account_id()
     manifest = manifest_utils.load(f)
+    manifest_index = manifest_utils.build_manifest_index(manifest)
+    hub_portfolios = manifest_utils.prefetch_hub_portfolios(manifest, puppet_account_id, manifest_index)
 
     task_defs = manifest_utils.convert_manifest_into_task_defs_for_launches(
-        manifest, puppet_account_id, False, False, include_expanded_from=True
+        manifest, puppet_account_id, False, False, include_expanded_from=True, manifest_index=manifest_index
     )
     for task in task_defs:
         tasks_to_run.append(
@@ -72,7 +79,8 @@ def generate_shares(f):
         )
 
     spoke_local_portfolios_tasks = manifest_utils.convert_manifest_into_task_defs_for_spoke_local_portfolios(
-        manifest, puppet_account_id, False, tasks_to_run
+        manifest, puppet_account_id, False, tasks_to_run, manifest_index=manifest_index,
+        hub_portfolios=hub_portfolios,
     )
 
     for task in spoke_local_portfolios_tasks:
@@ -92,13 +100,68 @@ def generate_shares(f):
     runner.run_tasks_for_generate_shares(tasks_to_run)
 
 
-def reset_provisioned_product_owner(f):
+def get_compiled_path_for(f):
+    return f.name.replace(".yaml", '-compiled.json')
+
+
+def get_fragment_cache_path_for(f):
+    return f.name.replace(".yaml", '-fragments-compiled.json')
+
+
+def get_account_ids_to_warm_for(manifest, single_account=None):
+    if single_account is not None:
+        return [single_account]
+    return list(dict.fromkeys(account.get('account_id') for account in manifest.get('accounts', [])))
+
+
+def load_manifest_and_compiled_launches(f, num_compile_workers=None, warm_sessions=False, single_account=None):
     puppet_account_id = config.get_puppet_account_id()
     manifest = manifest_utils.load(f)
+    warming = None
+    if warm_sessions:
+        warming = sessions.warm_in_background([
+            sessions.get_puppet_role_arn_for(account_id)
+            for account_id in get_account_ids_to_warm_for(manifest, single_account)
+        ])
+    manifest_index = manifest_utils.build_manifest_index(manifest)
+    should_use_sns = config.get_should_use_sns(os.environ.get("AWS_DEFAULT_REGION"))
+    should_use_product_plans = config.get_should_use_product_plans(os.environ.get("AWS_DEFAULT_REGION"))
 
-    task_defs = manifest_utils.convert_manifest_into_task_defs_for_launches(
-        manifest, puppet_account_id, False, False
-    )
+    inputs = {
+        'puppet_account_id': puppet_account_id,
+        'puppet_version': config.get_puppet_version(),
+        'config': config.get_config(os.environ.get("AWS_DEFAULT_REGION")),
+    }
+    key = manifest_utils.get_compiled_key_for(json.dumps(manifest, sort_keys=True, default=str), inputs)
+    compiled_path = get_compiled_path_for(f)
+    compiled = manifest_utils.load_compiled(compiled_path, key)
+    if compiled is None and manifest.get('fragments'):
+        logger.info(f"Compiling the changed fragments of {f.name}")
+        fragment_cache_path = get_fragment_cache_path_for(f)
+        fragment_cache = manifest_utils.load_fragment_cache(fragment_cache_path)
+        compiled = manifest_utils.compile_launches_by_fragment(
+            manifest, puppet_account_id, should_use_sns, should_use_product_plans, manifest_index=manifest_index,
+            cache=fragment_cache, inputs=inputs,
+        )
+        manifest_utils.save_fragment_cache(fragment_cache_path, fragment_cache)
+        manifest_utils.save_compiled(compiled_path, key, compiled)
+    elif compiled is None:
+        logger.info(f"Compiling {f.name}")
+        compiled = manifest_utils.compile_launches(
+            manifest, puppet_account_id, should_use_sns, should_use_product_plans, manifest_index=manifest_index,
+            max_workers=num_compile_workers,
+        )
+        manifest_utils.save_compiled(compiled_path, key, compiled)
+    else:
+        logger.info(f"Using the compiled launches in {compiled_path}")
+    if warming is not None:
+        warming.join()
+    return manifest, manifest_index, compiled
+
+
+def reset_provisioned_product_owner(f):
+    manifest, manifest_index, compiled = load_manifest_and_compiled_launches(f)
+    task_defs = compiled.get('task_defs')
 
     tasks_to_run = []
     for task in task_defs:
@@ -115,94 +178,134 @@ def reset_provisioned_product_owner(f):
     runner.run_tasks(tasks_to_run, 10)
 
 
-def generate_tasks(f, single_account=None, dry_run=False):
+def get_filters_for(single_account=None, launch=None, region=None, tag=None, portfolio=None):
+    filters = {
+        'account_id': single_account,
+        'launch_name': launch,
+        'region': region,
+        'tag': tag,
+        'portfolio': portfolio,
+    }
+    if all(value is None for value in filters.values()):
+        return None
+    return filters
+
+
+def get_launch_task_for(task, should_use_sns, dry_run):
+    task_status = task.get('status')
+    if task_status == constants.PROVISIONED:
+        task_kwargs = {k: v for k, v in task.items() if k != 'status'}
+        task_kwargs['should_use_sns'] = should_use_sns
+        if dry_run:
+            task_to_run = provisioning_tasks.ProvisionProductDryRunTask(**task_kwargs)
+        else:
+            task_to_run = provisioning_tasks.ProvisionProductTask(**task_kwargs)
+    elif task_status == constants.TERMINATED:
+        for attribute in constants.DISALLOWED_ATTRIBUTES_FOR_TERMINATED_LAUNCHES:
+            logger.info(f"checking {task.get('launch_name')} for disallowed attributes")
+            attribute_value = task.get(attribute)
+            if attribute_value is not None:
+                if isinstance(attribute_value, (list, tuple)):
+                    if len(attribute_value) != 0:
+                        raise Exception(f"Launch {task.get('launch_name')} has disallowed attribute: {attribute}")
+                elif isinstance(attribute_value, Mapping):
+                    if len(attribute_value.keys()) != 0:
+                        raise Exception(f"Launch {task.get('launch_name')} has disallowed attribute: {attribute}")
+                else:
+                    raise Exception(f"Launch {task.get('launch_name')} has disallowed attribute: {attribute}")
+
+        task_kwargs = {
+            k: v for k, v in task.items() if k not in [
+                'status',
+                'parameters_id',
+                'should_use_sns',
+                'requested_priority',
+                'should_use_product_plans',
+                'pre_actions',
+                'post_actions',
+            ]
+        }
+
+        if dry_run:
+            task_to_run = provisioning_tasks.TerminateProductDryRunTask(**task_kwargs)
+        else:
+            task_to_run = provisioning_tasks.TerminateProductTask(**task_kwargs)
+    else:
+        raise Exception(f"Unsupported status of {task_status}")
+    return task_to_run
+
+
+def generate_tasks(
+        f, single_account=None, dry_run=False, launch=None, region=None, tag=None, portfolio=None, since=None,
+        num_compile_workers=None
+):
     puppet_account_id = config.get_puppet_account_id()
-    manifest = manifest_utils.load(f)
+    manifest, manifest_index, compiled = load_manifest_and_compiled_launches(
+        f, num_compile_workers, warm_sessions=True, single_account=single_account
+    )
+    filters = get_filters_for(single_account, launch, region, tag, portfolio)
     tasks_to_run = []
+    hub_portfolios = {}
+    if not dry_run:
+        hub_portfolios = manifest_utils.prefetch_hub_portfolios(
+            manifest, puppet_account_id, manifest_index, filters=filters
+        )
 
     should_use_sns = config.get_should_use_sns(os.environ.get("AWS_DEFAULT_REGION"))
     should_use_product_plans = config.get_should_use_product_plans(os.environ.get("AWS_DEFAULT_REGION"))
 
     task_defs = manifest_utils.convert_manifest_into_task_defs_for_launches(
-        manifest, puppet_account_id, should_use_sns, should_use_product_plans
+        manifest, puppet_account_id, should_use_sns, should_use_product_plans, manifest_index=manifest_index,
+        filters=filters, compiled=compiled,
     )
 
-    for task in task_defs:
-        if single_account is not None:
-            if task.get('account_id') != single_account:
-                continue
-        task_status = task.get('status')
-        del task['status']
-        if task_status == constants.PROVISIONED:
-            task['should_use_sns'] = should_use_sns
-            if dry_run:
-                tasks_to_run.append(provisioning_tasks.ProvisionProductDryRunTask(**task))
-            else:
-                tasks_to_run.append(provisioning_tasks.ProvisionProductTask(**task))
-        elif task_status == constants.TERMINATED:
-            for attribute in constants.DISALLOWED_ATTRIBUTES_FOR_TERMINATED_LAUNCHES:
-                logger.info(f"checking {task.get('launch_name')} for disallowed attributes")
-                attribute_value = task.get(attribute)
-                if attribute_value is not None:
-                    if isinstance(attribute_value, list):
-                        if len(attribute_value) != 0:
-                            raise Exception(f"Launch {task.get('launch_name')} has disallowed attribute: {attribute}")
-                    elif isinstance(attribute_value, dict):
-                        if len(attribute_value.keys()) != 0:
-                            raise Exception(f"Launch {task.get('launch_name')} has disallowed attribute: {attribute}")
-                    else:
-                        raise Exception(f"Launch {task.get('launch_name')} has disallowed attribute: {attribute}")
+    changed_spoke_local_portfolio_keys = None
+    if since is not None:
+        previous_manifest, previous_manifest_index, previous_compiled = load_manifest_and_compiled_launches(
+            since, num_compile_workers
+        )
+        changed_keys, removed_keys = manifest_utils.get_changed_launch_keys(previous_compiled, compiled)
+        number_of_task_defs = len(task_defs)
+        task_defs = manifest_utils.select_changed_launches(task_defs, changed_keys)
+        click.echo(
+            f"Scheduling {len(task_defs)} of {number_of_task_defs} launch tasks, "
+            f"{number_of_task_defs - len(task_defs)} are unchanged since {since.name}"
+        )
+        for launch_name, account_id, region_name in removed_keys:
+            click.echo(f"{launch_name} in {account_id} {region_name} is no longer in the manifest, skipping it")
+        changed_spoke_local_portfolio_keys = manifest_utils.get_changed_spoke_local_portfolio_keys(
+            previous_manifest, previous_manifest_index, manifest, manifest_index
+        )
 
-            del task['launch_parameters']
-            del task['manifest_parameters']
-            del task['account_parameters']
-            del task['should_use_sns']
-            del task['requested_priority']
-            del task['should_use_product_plans']
-            del task['pre_actions']
-            del task['post_actions']
-
-            if dry_run:
-                tasks_to_run.append(provisioning_tasks.TerminateProductDryRunTask(**task))
-            else:
-                tasks_to_run.append(provisioning_tasks.TerminateProductTask(**task))
-        else:
-            raise Exception(f"Unsupported status of {task_status}")
+    for task in task_defs:
+        task_to_run = get_launch_task_for(task, should_use_sns, dry_run)
+        workflow_tasks.register_task(manifest_utils.get_key_for(task), task_to_run)
+        tasks_to_run.append(task_to_run)
 
     if not dry_run:
         spoke_local_portfolios_tasks = manifest_utils.convert_manifest_into_task_defs_for_spoke_local_portfolios(
-            manifest, puppet_account_id, should_use_sns, tasks_to_run
+            manifest, puppet_account_id, should_use_sns, tasks_to_run, manifest_index=manifest_index,
+            hub_portfolios=hub_portfolios, filters=filters, changed_keys=changed_spoke_local_portfolio_keys,
         )
-        for spoke_local_portfolios_task in spoke_local_portfolios_tasks:
-            if single_account is not None:
-                param_kwargs = spoke_local_portfolios_task.param_kwargs
-                logger.info(f"EPF:: {param_kwargs}")
-                if param_kwargs.get('account_id', 'not_an_account_id') != single_account:
-                    continue
-            tasks_to_run.append(spoke_local_portfolios_task)
+        tasks_to_run += spoke_local_portfolios_tasks
     return tasks_to_run
 
 
-def deploy(f, single_account, num_workers=10, dry_run=False):
-    tasks_to_run = generate_tasks(f, single_account, dry_run)
-    runner.run_tasks(tasks_to_run, num_workers, dry_run)
+def deploy(
+        f, single_account, num_workers=10, dry_run=False, launch=None, region=None, tag=None, portfolio=None,
+        since=None, num_compile_workers=None, execution_mode=constants.EXECUTION_MODE_PROCESSES
+):
+    tasks_to_run = generate_tasks(
+        f, single_account, dry_run, launch, region, tag, portfolio, since, num_compile_workers
+    )
+    runner.run_tasks(tasks_to_run, num_workers, dry_run, execution_mode)
 
 
-def graph(f):
-    tasks_to_run = generate_tasks(f)
-    lines = []
-    nodes = []
-    for task in tasks_to_run:
-        lines += task.get_graph_lines()
-        nodes.append(task.graph_node())
-    print(json.dumps(lines))
-    click.echo("digraph G {\n")
-    click.echo("node [shape=record fontname=Arial];")
-    for node in nodes:
-        click.echo(f"{node};")
-    for line in lines:
-        click.echo(f"{line} [label=\"depends on\"];")
-    click.echo("}")
+def graph(f, output_format='dot', launch=None, single_account=None, depth=None):
+    manifest = manifest_utils.load(f)
+    manifest_index = manifest_utils.build_manifest_index(manifest)
+    nodes = graph_utils.iter_nodes(manifest, manifest_index, launch, single_account, depth)
+    graph_utils.writers.get(output_format)(nodes, click.echo)
 
 
 def _do_bootstrap_spoke(puppet_account_id, cloudformation, puppet_version, permission_boundary):
@@ -386,7 +489,7 @@ def seed(complexity, p):
 
 
 def list_launches(f, format):
-    manifest = manifest_utils.load(f)
+    manifest, manifest_index, compiled = load_manifest_and_compiled_launches(f)
     if format == "table":
         click.echo("Getting details from your account...")
     all_regions = config.get_regions(os.environ.get("AWS_DEFAULT_REGION"))
@@ -396,7 +499,7 @@ def list_launches(f, format):
         for region_name in all_regions:
             role = "arn:aws:iam::{}:role/{}".format(account_id, 'servicecatalog-puppet/PuppetRole')
             logger.info("Looking at region: {} in account: {}".format(region_name, account_id))
-            with betterboto_client.CrossAccountClientContextManager(
+            with sessions.CrossAccountClientContextManager(
                     'servicecatalog', role, 'sc-{}-{}'.format(account_id, region_name), region_name=region_name
             ) as spoke_service_catalog:
                 response = spoke_service_catalog.list_accepted_portfolio_shares()
@@ -452,7 +555,7 @@ def list_launches(f, format):
                                 ))
 
     results = {}
-    tasks = generate_tasks(f)
+    tasks = compiled.get('task_defs')
     # deployments[account_id][constants.LAUNCHES][launch_name][region_name]
     for task in tasks:
         account_id = task.get('account_id')
@@ -519,7 +622,7 @@ def list_launches(f, format):
         raise Exception(f"Unsupported format: {format}")
 
 
-def expand(f):
+def expand(f, org_snapshot=None, org_snapshot_ttl=86400, json_sidecar=False):
     click.echo('Expanding')
     manifest = manifest_utils.load(f)
     org_iam_role_arn = config.get_org_iam_role_arn()
@@ -531,14 +634,17 @@ def expand(f):
         with betterboto_client.CrossAccountClientContextManager(
                 'organizations', org_iam_role_arn, 'org-iam-role'
         ) as client:
-            new_manifest = manifest_utils.expand_manifest(manifest, client)
+            snapshot = organizations.get_snapshot(client, org_snapshot, org_snapshot_ttl)
+            new_manifest = manifest_utils.expand_manifest(manifest, client, snapshot)
     click.echo('Expanded')
     new_name = f.name.replace(".yaml", '-expanded.yaml')
     logger.info('Writing new manifest: {}'.format(new_name))
+    content = manifest_utils.dump_yaml(new_manifest)
     with open(new_name, 'w') as output:
-        output.write(
-            yaml.safe_dump(new_manifest, default_flow_style=False)
-        )
+        output.write(content)
+    if json_sidecar:
+        logger.info('Writing json sidecar: {}'.format(manifest_utils.get_sidecar_path_for(new_name)))
+        manifest_utils.save_sidecar(new_name, content, new_manifest)
 
 
 def validate(f):
@@ -0,0 +1,196 @@
+import json
+import logging
+from collections import deque
+from xml.sax.saxutils import escape, quoteattr
+
+from servicecatalog_puppet import constants
+from servicecatalog_puppet import manifest_utils
+from servicecatalog_puppet.workflow import provisioning
+
+logger = logging.getLogger(__file__)
+
+LAUNCH = 'launch'
+SPOKE_LOCAL_PORTFOLIO = 'spoke-local-portfolio'
+
+
+def get_launch_node_id_for(launches, key):
+    launch_name, account_id, region = key
+    launch_details = launches.get(launch_name)
+    node_id = provisioning.get_node_id_for(
+        launch_name,
+        launch_details.get('portfolio'),
+        launch_details.get('product'),
+        launch_details.get('version'),
+        account_id,
+        region,
+    )
+    return f"{provisioning.ProvisionProductTask.__name__}_{node_id}"
+
+
+def get_spoke_local_portfolio_node_id_for(portfolio, account_id, region):
+    return f"CreateSpokeLocalPortfolioTask_{portfolio}_{account_id}_{region}"
+
+
+def iter_launch_task_defs(manifest, manifest_index):
+    # the graph does not depend on the puppet account or config so it can be compiled offline
+    return manifest_utils.iter_task_defs_for_launches(manifest, None, False, False, manifest_index=manifest_index)
+
+
+def iter_spoke_local_portfolios(manifest, manifest_index, dependency_index):
+    for launch_name, launch_details in manifest.get(constants.SPOKE_LOCAL_PORTFOLIOS, {}).items():
+        for account, regions in manifest_utils.get_accounts_for(launch_details.get('deploy_to'), manifest_index):
+            account_id = account.get('account_id')
+            for region in manifest_utils.get_regions_for(regions, account, launch_name):
+                dependencies = []
+                for depends_on in launch_details.get('depends_on', []):
+                    dependencies += manifest_utils.get_dependency_keys_for(
+                        depends_on, account_id, region, dependency_index
+                    )
+                yield (launch_name, account_id, region), launch_details, dependencies
+
+
+def matches(key, launch, account_id):
+    if launch is not None and key[0] != launch:
+        return False
+    if account_id is not None and key[1] != account_id:
+        return False
+    return True
+
+
+def select_keys(manifest, manifest_index, launch=None, account_id=None, depth=None):
+    edges = {
+        manifest_utils.get_key_for(task_def): task_def.get('dependencies')
+        for task_def in iter_launch_task_defs(manifest, manifest_index)
+    }
+    dependency_index = manifest_utils.build_dependency_index(edges.keys())
+
+    selected_spoke_local_portfolio_keys = set()
+    keys_to_visit = deque((key, 0) for key in edges.keys() if matches(key, launch, account_id))
+    for key, _, dependencies in iter_spoke_local_portfolios(manifest, manifest_index, dependency_index):
+        if matches(key, launch, account_id):
+            selected_spoke_local_portfolio_keys.add(key)
+            if depth is None or depth > 0:
+                keys_to_visit.extend((dependency_key, 1) for dependency_key in dependencies)
+
+    selected_launch_keys = set()
+    while len(keys_to_visit) > 0:
+        key, key_depth = keys_to_visit.popleft()
+        if key in selected_launch_keys:
+            continue
+        selected_launch_keys.add(key)
+        if depth is None or key_depth < depth:
+            keys_to_visit.extend((dependency_key, key_depth + 1) for dependency_key in edges.get(key))
+
+    return selected_launch_keys, selected_spoke_local_portfolio_keys
+
+
+def iter_nodes(manifest, manifest_index, launch=None, account_id=None, depth=None):
+    launches = manifest.get(constants.LAUNCHES, {})
+    selected_launch_keys = None
+    selected_spoke_local_portfolio_keys = None
+    if launch is not None or account_id is not None:
+        selected_launch_keys, selected_spoke_local_portfolio_keys = select_keys(
+            manifest, manifest_index, launch, account_id, depth
+        )
+
+    launch_keys = []
+    for task_def in iter_launch_task_defs(manifest, manifest_index):
+        key = manifest_utils.get_key_for(task_def)
+        launch_keys.append(key)
+        if selected_launch_keys is not None and key not in selected_launch_keys:
+            continue
+        yield {
+            'id': get_launch_node_id_for(launches, key),
+            'type': LAUNCH,
+            'launch_name': task_def.get('launch_name'),
+            'portfolio': task_def.get('portfolio'),
+            'product': task_def.get('product'),
+            'version': task_def.get('version'),
+            'account_id': task_def.get('account_id'),
+            'region': task_def.get('region'),
+            'status': task_def.get('status'),
+            'dependencies': [
+                get_launch_node_id_for(launches, dependency_key)
+                for dependency_key in task_def.get('dependencies')
+                if selected_launch_keys is None or dependency_key in selected_launch_keys
+            ],
+        }
+
+    dependency_index = manifest_utils.build_dependency_index(launch_keys)
+    for key, launch_details, dependencies in iter_spoke_local_portfolios(manifest, manifest_index, dependency_index):
+        if selected_spoke_local_portfolio_keys is not None and key not in selected_spoke_local_portfolio_keys:
+            continue
+        launch_name, account_id, region = key
+        yield {
+            'id': get_spoke_local_portfolio_node_id_for(launch_details.get('portfolio'), account_id, region),
+            'type': SPOKE_LOCAL_PORTFOLIO,
+            'launch_name': launch_name,
+            'portfolio': launch_details.get('portfolio'),
+            'account_id': account_id,
+            'region': region,
+            'dependencies': [
+                get_launch_node_id_for(launches, dependency_key)
+                for dependency_key in dependencies
+                if selected_launch_keys is None or dependency_key in selected_launch_keys
+            ],
+        }
+
+
+def get_dot_node_for(node):
+    if node.get('type') == LAUNCH:
+        return provisioning.get_graph_node_for(
+            provisioning.ProvisionProductTask.__name__,
+            node.get('launch_name'),
+            node.get('portfolio'),
+            node.get('product'),
+            node.get('version'),
+            node.get('account_id'),
+            node.get('region'),
+        )
+    label = f"<b>CreateSpokeLocalPortfolio</b><br/>Portfolio: {node.get('portfolio')}<br/>AccountId: {node.get('account_id')}<br/>Region: {node.get('region')}"
+    return f"\"{node.get('id')}\" [fillcolor=chocolate style=filled label= < {label} >]"
+
+
+def write_dot(nodes, echo):
+    echo("digraph G {\n")
+    echo("node [shape=record fontname=Arial];")
+    for node in nodes:
+        echo(f"{get_dot_node_for(node)};")
+        for dependency in node.get('dependencies'):
+            echo(f"\"{node.get('id')}\" -> \"{dependency}\" [label=\"depends on\"];")
+    echo("}")
+
+
+def write_json(nodes, echo):
+    echo("{")
+    separator = ""
+    for node in nodes:
+        echo(f"{separator}{json.dumps(node.get('id'))}: {json.dumps({k: v for k, v in node.items() if k != 'id'})}")
+        separator = ","
+    echo("}")
+
+
+def write_graphml(nodes, echo):
+    attributes = ['type', 'launch_name', 'portfolio', 'product', 'version', 'account_id', 'region', 'status']
+    echo('<?xml version="1.0" encoding="UTF-8"?>')
+    echo('<graphml xmlns="http://graphml.graphdrawing.org/xmlns">')
+    for attribute in attributes:
+        echo(f'  <key id="{attribute}" for="node" attr.name="{attribute}" attr.type="string"/>')
+    echo('  <graph id="G" edgedefault="directed">')
+    for node in nodes:
+        echo(f"    <node id={quoteattr(node.get('id'))}>")
+        for attribute in attributes:
+            if node.get(attribute) is not None:
+                echo(f"      <data key=\"{attribute}\">{escape(str(node.get(attribute)))}</data>")
+        echo("    </node>")
+        for dependency in node.get('dependencies'):
+            echo(f"    <edge source={quoteattr(node.get('id'))} target={quoteattr(dependency)}/>")
+    echo("  </graph>")
+    echo("</graphml>")
+
+
+writers = {
+    'dot': write_dot,
+    'json': write_json,
+    'graphml': write_graphml,
+}
@@ -0,0 +1,86 @@
+# Copyright 2019 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+import json
+from xml.etree import ElementTree
+
+import pytest
+from pytest import fixture
+
+
+@fixture
+def sut():
+    from servicecatalog_puppet import graph
+    return graph
+
+
+def launch(product, depends_on=[]):
+    return {
+        'portfolio': 'p', 'product': product, 'version': 'v1', 'depends_on': depends_on,
+        'deploy_to': {'tags': [{'tag': 'type:prod', 'regions': ['eu-west-1']}]},
+    }
+
+
+manifest = {
+    'accounts': [
+        {'account_id': '1', 'tags': ['type:prod']},
+        {'account_id': '2', 'tags': ['type:prod']},
+    ],
+    'launches': {
+        'base': launch('base'),
+        'middle': launch('middle', ['base']),
+        'top': launch('top', ['middle']),
+    },
+    'spoke-local-portfolios': {
+        'spoke': {
+            'portfolio': 'spoke-portfolio', 'depends_on': ['top'],
+            'deploy_to': {'tags': [{'tag': 'type:prod', 'regions': ['eu-west-1']}]},
+        },
+    },
+}
+
+
+@pytest.mark.parametrize(
+    "launch_name,account_id,depth,expected_result",
+    [
+        (None, None, None, [
+            'base-1', 'base-2', 'middle-1', 'middle-2', 'top-1', 'top-2', 'spoke-1', 'spoke-2',
+        ]),
+        ('top', '1', None, ['base-1', 'middle-1', 'top-1']),
+        ('top', '1', 1, ['middle-1', 'top-1']),
+        ('spoke', '2', 1, ['top-2', 'spoke-2']),
+    ]
+)
+def test_iter_nodes_selects_the_subgraph(sut, launch_name, account_id, depth, expected_result):
+    # setup
+    from servicecatalog_puppet import manifest_utils
+    manifest_index = manifest_utils.build_manifest_index(manifest)
+
+    # exercise
+    actual_result = list(sut.iter_nodes(manifest, manifest_index, launch_name, account_id, depth))
+
+    # verify
+    assert [f"{node.get('launch_name')}-{node.get('account_id')}" for node in actual_result] == expected_result
+    node_ids = {node.get('id') for node in actual_result}
+    for node in actual_result:
+        assert set(node.get('dependencies')) <= node_ids
+
+
+def test_writers_produce_parsable_output(sut):
+    # setup
+    from servicecatalog_puppet import manifest_utils
+    manifest_index = manifest_utils.build_manifest_index(manifest)
+    output = {'json': [], 'graphml': []}
+
+    # exercise
+    for output_format, lines in output.items():
+        sut.writers.get(output_format)(sut.iter_nodes(manifest, manifest_index, 'top', '1'), lines.append)
+
+    # verify
+    adjacency = json.loads("\n".join(output.get('json')))
+    top = sut.get_launch_node_id_for(manifest.get('launches'), ('top', '1', 'eu-west-1'))
+    middle = sut.get_launch_node_id_for(manifest.get('launches'), ('middle', '1', 'eu-west-1'))
+    assert adjacency.get(top).get('dependencies') == [middle]
+    graphml = ElementTree.fromstring("\n".join(output.get('graphml')))
+    namespace = '{http://graphml.graphdrawing.org/xmlns}'
+    assert len(graphml.findall(f"{namespace}graph/{namespace}node")) == 3
+    assert len(graphml.findall(f"{namespace}graph/{namespace}edge")) == 2
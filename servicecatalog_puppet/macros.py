@@ -1,9 +1,60 @@
-def get_accounts_for_path(client, path):
-    ou = client.convert_path_to_ou(path)
-    response = client.list_children_nested(ParentId=ou, ChildType='ACCOUNT')
-    return ",".join([r.get('Id') for r in response])
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from servicecatalog_puppet import organizations
+
+logger = logging.getLogger(__file__)
+
+
+def get_accounts_for_path(client, path, ou_tree=None):
+    if ou_tree is None:
+        ou = client.convert_path_to_ou(path)
+        response = client.list_children_nested(ParentId=ou, ChildType='ACCOUNT')
+        return ",".join([r.get('Id') for r in response])
+    ou = organizations.get_ou_for_path(ou_tree, path)
+    return ",".join(organizations.get_accounts_for_ou(ou_tree, ou))
 
 
 macros = {
     'get_accounts_for_path': get_accounts_for_path
 }
+
+
+def get_key_for(macro):
+    return macro.get('method'), json.dumps(macro.get('args'), sort_keys=True, default=str)
+
+
+def run_macro(client, macro, ou_tree):
+    macro_to_run = macros.get(macro.get('method'))
+    if macro_to_run is None:
+        raise Exception(f"Unsupported macro: {macro.get('method')}")
+    start = time.time()
+    result = macro_to_run(client, macro.get('args'), ou_tree)
+    logger.info(f"Macro {macro.get('method')} with args {macro.get('args')} took {time.time() - start:.3f}s")
+    return result
+
+
+def run_macros(client, parameter_sets, ou_tree=None, max_workers=5):
+    invocations = {}
+    for parameters in parameter_sets:
+        for parameter_name, parameter_details in parameters.items():
+            if parameter_details.get('macro'):
+                macro = parameter_details.get('macro')
+                invocations.setdefault(get_key_for(macro), macro)
+
+    logger.info(f"Running {len(invocations)} unique macros")
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = dict(zip(
+            invocations.keys(),
+            executor.map(lambda macro: run_macro(client, macro, ou_tree), invocations.values()),
+        ))
+    logger.info(f"Finished running {len(invocations)} unique macros in {time.time() - start:.3f}s")
+
+    for parameters in parameter_sets:
+        for parameter_name, parameter_details in parameters.items():
+            if parameter_details.get('macro'):
+                parameter_details['default'] = results[get_key_for(parameter_details.get('macro'))]
+                del parameter_details['macro']
@@ -0,0 +1,47 @@
+# Copyright 2019 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+import pytest
+from pytest import fixture
+
+
+@fixture
+def sut():
+    from servicecatalog_puppet import macros
+    return macros
+
+
+def test_run_macros_dedupes_invocations(sut, mocker):
+    # setup
+    mocked_macro = mocker.Mock(return_value='1,2')
+    mocker.patch.dict(sut.macros, {'get_accounts_for_path': mocked_macro})
+    client = mocker.Mock()
+    ou_tree = {}
+    manifest_parameters = {
+        'a': {'macro': {'method': 'get_accounts_for_path', 'args': '/prod'}},
+    }
+    account_parameters = {
+        'b': {'macro': {'method': 'get_accounts_for_path', 'args': '/prod'}},
+        'c': {'default': 'd'},
+    }
+
+    # exercise
+    sut.run_macros(client, [manifest_parameters, account_parameters], ou_tree)
+
+    # verify
+    mocked_macro.assert_called_once_with(client, '/prod', ou_tree)
+    assert manifest_parameters == {'a': {'default': '1,2'}}
+    assert account_parameters == {'b': {'default': '1,2'}, 'c': {'default': 'd'}}
+
+
+def test_run_macros_raises_for_unsupported_macros(sut, mocker):
+    # setup
+    parameters = {
+        'a': {'macro': {'method': 'foo', 'args': 'bar'}},
+    }
+
+    # exercise
+    with pytest.raises(Exception) as e:
+        sut.run_macros(mocker.Mock(), [parameters])
+
+    # verify
+    assert str(e.exconly()) == "Exception: Unsupported macro: foo"
@@ -1,26 +1,108 @@
+import hashlib
+import os
 import yaml
 import logging
 import json
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from copy import deepcopy
+from types import MappingProxyType
 
 from servicecatalog_puppet.workflow import portfoliomanagement
 from servicecatalog_puppet.workflow import provisioning
+from servicecatalog_puppet.workflow import tasks as workflow_tasks
 from servicecatalog_puppet import config
-from servicecatalog_puppet.macros import macros
+from servicecatalog_puppet import macros
 from servicecatalog_puppet import constants, aws
+from servicecatalog_puppet import organizations
+from servicecatalog_puppet import tag_expressions
+
+try:
+    from yaml import CSafeLoader as SafeLoader, CSafeDumper as SafeDumper
+except ImportError:
+    from yaml import SafeLoader, SafeDumper
 
 logger = logging.getLogger(__file__)
 
 
+def load_yaml(content):
+    return yaml.load(content, Loader=SafeLoader)
+
+
+def dump_yaml(value):
+    return yaml.dump(value, Dumper=SafeDumper, default_flow_style=False)
+
+
+def get_sidecar_path_for(path):
+    return path.replace(".yaml", '.json')
+
+
+def get_sidecar_key_for(content):
+    return hashlib.sha256(content.encode('utf-8') if isinstance(content, str) else content).hexdigest()
+
+
+def save_sidecar(path, content, manifest):
+    with open(get_sidecar_path_for(path), 'w') as f:
+        f.write(json.dumps({'key': get_sidecar_key_for(content), 'manifest': manifest}, default=str))
+
+
+def load_sidecar(path, content):
+    sidecar_path = get_sidecar_path_for(path)
+    if sidecar_path == path or not os.path.exists(sidecar_path):
+        return None
+    with open(sidecar_path, 'r') as f:
+        sidecar = json.loads(f.read())
+    if sidecar.get('key') != get_sidecar_key_for(content):
+        logger.info(f"{sidecar_path} is out of date, ignoring it")
+        return None
+    logger.info(f"Using {sidecar_path}")
+    return sidecar.get('manifest')
+
+
 def load(f):
-    return yaml.safe_load(f.read())
+    content = f.read()
+    path = getattr(f, 'name', '')
+    if path:
+        manifest = load_sidecar(path, content)
+        if manifest is not None:
+            return manifest
+    return load_includes_for(load_yaml(content), os.path.dirname(path))
+
 
+def load_includes_for(manifest, base_path):
+    includes = manifest.pop('includes', [])
+    for include in includes:
+        logger.info(f"Including {include}")
+        with open(os.path.join(base_path, include), 'r') as f:
+            fragment = load_yaml(f.read()) or {}
+        merge_fragment(manifest, include, fragment)
+    return manifest
 
-def expand_manifest(manifest, client):
+
+def merge_fragment(manifest, include, fragment):
+    if fragment.get('includes'):
+        raise Exception(f"Includes are not supported in manifest fragments: {include}")
+    manifest.setdefault('accounts', []).extend(fragment.get('accounts', []))
+    for section in [constants.LAUNCHES, constants.SPOKE_LOCAL_PORTFOLIOS, 'actions', 'parameters']:
+        items = manifest.setdefault(section, {})
+        for name, details in fragment.get(section, {}).items():
+            if name in items:
+                raise Exception(f"{name} in {include} is already defined in {section}")
+            items[name] = details
+    manifest.setdefault('fragments', {})[include] = {
+        'launches': list(fragment.get(constants.LAUNCHES, {}).keys()),
+    }
+
+
+def expand_manifest(manifest, client, snapshot=None):
     new_manifest = deepcopy(manifest)
     new_accounts = new_manifest['accounts'] = []
 
     logger.info('Starting the expand')
+    if snapshot is None:
+        snapshot = organizations.build_snapshot(client)
+    account_index = snapshot.get('accounts')
+    ou_tree = snapshot.get('ou_tree')
 
     for account in manifest.get('accounts'):
         if account.get('account_id'):
@@ -30,264 +112,813 @@ def expand_manifest(manifest, client):
             ou = account.get('ou')
             logger.info("Found an ou: {}".format(ou))
             if ou.startswith('/'):
-                new_accounts += expand_path(account, client)
+                new_accounts += expand_path(account, client, account_index, ou_tree)
             else:
-                new_accounts += expand_ou(account, client)
+                new_accounts += expand_ou(account, client, account_index, ou_tree)
 
     logger.debug(new_accounts)
 
-    for parameter_name, parameter_details in new_manifest.get('parameters', {}).items():
-        if parameter_details.get('macro'):
-            macro_to_run = macros.get(parameter_details.get('macro').get('method'))
-            result = macro_to_run(client, parameter_details.get('macro').get('args'))
-            parameter_details['default'] = result
-            del parameter_details['macro']
-
-    for first_account in new_accounts:
-        for parameter_name, parameter_details in first_account.get('parameters', {}).items():
-            if parameter_details.get('macro'):
-                macro_to_run = macros.get(parameter_details.get('macro').get('method'))
-                result = macro_to_run(client, parameter_details.get('macro').get('args'))
-                parameter_details['default'] = result
-                del parameter_details['macro']
-
-        times_seen = 0
-        for second_account in new_accounts:
-            if first_account.get('account_id') == second_account.get('account_id'):
-                times_seen += 1
-                if times_seen > 1:
-                    message = "{} has been seen twice.".format(first_account.get('account_id'))
-                    if first_account.get('expanded_from'):
-                        message += "  It was included due to it being in the ou: {}".format(
-                            first_account.get('expanded_from')
-                        )
-                    if second_account.get('expanded_from'):
-                        message += "  It was included due to it being in the ou: {}".format(
-                            second_account.get('expanded_from')
-                        )
-                    raise Exception(message)
+    parameter_sets = [new_manifest.get('parameters', {})]
+    parameter_sets += [account.get('parameters', {}) for account in new_accounts]
+    parameter_sets += [
+        launch_details.get('parameters', {}) for launch_details in new_manifest.get(constants.LAUNCHES, {}).values()
+    ]
+    macros.run_macros(client, parameter_sets, ou_tree)
 
-    for launch_name, launch_details in new_manifest.get(constants.LAUNCHES, {}).items():
-        for parameter_name, parameter_details in launch_details.get('parameters', {}).items():
-            if parameter_details.get('macro'):
-                macro_to_run = macros.get(parameter_details.get('macro').get('method'))
-                result = macro_to_run(client, parameter_details.get('macro').get('args'))
-                parameter_details['default'] = result
-                del parameter_details['macro']
+    duplicate_accounts = get_duplicate_accounts(new_accounts)
+    if len(duplicate_accounts) > 0:
+        messages = []
+        for account_id, accounts in duplicate_accounts.items():
+            message = f"{account_id} has been seen {len(accounts)} times."
+            for account in accounts:
+                if account.get('expanded_from'):
+                    message += f"  It was included due to it being in the ou: {account.get('expanded_from')}"
+                else:
+                    message += "  It was included by its account_id"
+            messages.append(message)
+        raise Exception("\n".join(messages))
 
     return new_manifest
 
 
-def expand_path(account, client):
-    ou = client.convert_path_to_ou(account.get('ou'))
+def get_duplicate_accounts(accounts):
+    accounts_by_id = {}
+    for account in accounts:
+        accounts_by_id.setdefault(account.get('account_id'), []).append(account)
+    return {
+        account_id: accounts_for_id for account_id, accounts_for_id in accounts_by_id.items() if len(accounts_for_id) > 1
+    }
+
+
+def get_account_details_for(account_id, client, account_index):
+    account_details = account_index.get(account_id)
+    if account_details is None:
+        logger.info(f"{account_id} was not in the account index, describing it")
+        account_details = client.describe_account(AccountId=account_id).get('Account')
+        account_index[account_id] = account_details
+    return account_details
+
+
+def expand_path(account, client, account_index, ou_tree):
+    ou = organizations.get_ou_for_path(ou_tree, account.get('ou'))
     account['ou'] = ou
-    return expand_ou(account, client)
+    return expand_ou(account, client, account_index, ou_tree)
 
 
-def expand_ou(original_account, client):
+def expand_ou(original_account, client, account_index, ou_tree):
     expanded = []
-    exclusions = original_account.get('exclude', {}).get('accounts', [])
+    exclusions = set(original_account.get('exclude', {}).get('accounts', []))
     ou_exclusions = original_account.get('exclude', {}).get('ous', [])
-    for ou_exclusion in ou_exclusions:
-        if ou_exclusion.startswith('/'):
-            ou_id = client.convert_path_to_ou(ou_exclusion)
-        else:
-            ou_id = ou_exclusion
-        children = client.list_children_nested(ParentId=ou_id, ChildType='ACCOUNT')
-        for child in children:
-            logger.info(f"Adding {child.get('Id')} to the exclusion list as it was in the ou {ou_exclusion}")
-            exclusions.append(child.get('Id'))
-
-    response = client.list_children_nested(ParentId=original_account.get('ou'), ChildType='ACCOUNT')
-    for result in response:
-        new_account_id = result.get('Id')
+    if len(ou_exclusions) > 0:
+        logger.info(f"Excluding the accounts in the ous: {', '.join(ou_exclusions)}")
+
+    account_ids = organizations.get_accounts_for_ou_excluding(ou_tree, original_account.get('ou'), ou_exclusions)
+    for new_account_id in account_ids:
         if new_account_id in exclusions:
             logger.info(f"Skipping {new_account_id} as it is in the exclusion list")
             continue
-        response = client.describe_account(AccountId=new_account_id)
-        new_account = deepcopy(original_account)
-        del new_account['ou']
-        if response.get('Account').get('Status') == "ACTIVE":
-            if response.get('Account').get('Name') is not None:
-                new_account['name'] = response.get('Account').get('Name')
-            new_account['email'] = response.get('Account').get('Email')
+        account_details = get_account_details_for(new_account_id, client, account_index)
+        if account_details.get('Status') == "ACTIVE":
+            new_account = deepcopy(original_account)
+            del new_account['ou']
+            if account_details.get('Name') is not None:
+                new_account['name'] = account_details.get('Name')
+            new_account['email'] = account_details.get('Email')
             new_account['account_id'] = new_account_id
             new_account['expanded_from'] = original_account.get('ou')
-            new_account['organization'] = response.get('Account').get('Arn').split(":")[5].split("/")[1]
+            new_account['organization'] = account_details.get('Arn').split(":")[5].split("/")[1]
             expanded.append(new_account)
         else:
-            logger.info(f"Skipping account as it is not ACTIVE: {json.dumps(response.get('Account'), default=str)}")
+            logger.info(f"Skipping account as it is not ACTIVE: {json.dumps(account_details, default=str)}")
     return expanded
 
 
+def freeze(value):
+    if isinstance(value, MappingProxyType):
+        return value
+    if isinstance(value, dict):
+        return MappingProxyType({k: freeze(v) for k, v in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(v) for v in value)
+    return value
+
+
+def thaw(value):
+    if isinstance(value, Mapping):
+        return {k: thaw(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [thaw(v) for v in value]
+    return value
+
+
+class TaskDef(Mapping):
+    __slots__ = (
+        'launch_name',
+        'portfolio',
+        'product',
+        'version',
+        'puppet_account_id',
+        'parameters',
+        'parameters_id',
+        'ssm_param_inputs',
+        'dependencies',
+        'retry_count',
+        'worker_timeout',
+        'ssm_param_outputs',
+        'should_use_sns',
+        'should_use_product_plans',
+        'requested_priority',
+        'status',
+        'pre_actions',
+        'post_actions',
+        'account_id',
+        'expanded_from',
+        'region',
+    )
+
+    def __init__(self, **kwargs):
+        for name, value in kwargs.items():
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise TypeError(f"{self.__class__.__name__} is immutable")
+
+    def __getitem__(self, key):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
+
+    def __iter__(self):
+        return (name for name in self.__slots__ if hasattr(self, name))
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({dict(self)})"
+
+
+def get_parameters_id_for(launch_name, account_id):
+    return f"{launch_name}/{account_id}"
+
+
+def merge_parameters(manifest_parameters, launch_parameters, account_parameters):
+    all_params = {}
+    all_params.update(manifest_parameters)
+    all_params.update(launch_parameters)
+    all_params.update(account_parameters)
+    for param_name, param_details in all_params.items():
+        if param_details.get('ssm'):
+            all_params[param_name] = {k: v for k, v in param_details.items() if k != 'default'}
+    return freeze(all_params)
+
+
+def build_manifest_index(manifest):
+    accounts_by_id = {}
+    accounts_by_tag = {}
+    for account in manifest.get('accounts', []):
+        accounts_by_id.setdefault(account.get('account_id'), account)
+        for tag in account.get('tags', []):
+            accounts_by_tag.setdefault(tag, []).append(account)
+    return {
+        'accounts_by_id': accounts_by_id,
+        'accounts_by_tag': accounts_by_tag,
+        'accounts': manifest.get('accounts', []),
+        'tag_bitsets': tag_expressions.build_bitsets(manifest.get('accounts', [])),
+    }
+
+
+def get_accounts_for(deploy_to, manifest_index):
+    for tag_list_item in deploy_to.get('tags', []):
+        if tag_list_item.get('expression') is not None:
+            accounts = tag_expressions.get_accounts_for(
+                tag_list_item.get('expression'), manifest_index.get('accounts'), manifest_index.get('tag_bitsets')
+            )
+        else:
+            accounts = manifest_index.get('accounts_by_tag').get(tag_list_item.get('tag'), [])
+        for account in accounts:
+            yield account, tag_list_item.get('regions')
+
+    for account_list_item in deploy_to.get('accounts', []):
+        account = manifest_index.get('accounts_by_id').get(account_list_item.get('account_id'))
+        if account is not None:
+            yield account, account_list_item.get('regions')
+
+
+def get_regions_for(regions, account, launch_name):
+    if isinstance(regions, str):
+        if regions in ["enabled", "regions_enabled", "enabled_regions"]:
+            return account.get('regions_enabled')
+        elif regions == 'default_region':
+            return [account.get('default_region')]
+        elif regions == "all":
+            return config.get_regions()
+        else:
+            raise Exception(f"Unsupported regions {regions} setting for launch: {launch_name}")
+    elif isinstance(regions, list):
+        return regions
+    else:
+        raise Exception(f"Unexpected regions of {regions} set for launch {launch_name}")
+
+
 def convert_manifest_into_task_defs_for_launches(
-        manifest, puppet_account_id, should_use_sns, should_use_product_plans, include_expanded_from=False
+        manifest, puppet_account_id, should_use_sns, should_use_product_plans, include_expanded_from=False,
+        manifest_index=None, filters=None, compiled=None, max_workers=None
+):
+    if manifest_index is None:
+        manifest_index = build_manifest_index(manifest)
+    if compiled is None:
+        compiled = compile_launches(
+            manifest, puppet_account_id, should_use_sns, should_use_product_plans, include_expanded_from,
+            manifest_index, max_workers,
+        )
+    task_defs = select_launches(compiled, manifest, manifest_index, filters)
+    for task_def in task_defs:
+        workflow_tasks.register_parameters(
+            task_def.get('parameters_id'), compiled.get('parameter_tables').get(task_def.get('parameters_id'))
+        )
+    return task_defs
+
+
+def compile_launches(
+        manifest, puppet_account_id, should_use_sns, should_use_product_plans, include_expanded_from=False,
+        manifest_index=None, max_workers=None
 ):
+    if max_workers is not None and max_workers > 1:
+        compiled = compile_launches_in_parallel(
+            manifest, puppet_account_id, should_use_sns, should_use_product_plans, include_expanded_from,
+            manifest_index, max_workers,
+        )
+    else:
+        parameter_tables = {}
+        compiled = {
+            'task_defs': list(iter_task_defs_for_launches(
+                manifest, puppet_account_id, should_use_sns, should_use_product_plans, include_expanded_from,
+                manifest_index, parameter_tables,
+            )),
+            'parameter_tables': parameter_tables,
+        }
+    get_topological_order_for({
+        get_key_for(task_def): list(task_def.get('dependencies')) for task_def in compiled.get('task_defs')
+    })
+    return compiled
+
+
+compile_worker_arguments = {}
+
+
+def init_compile_worker(arguments):
+    compile_worker_arguments.update(arguments)
+
+
+def compile_launches_in_worker(launch_names):
+    parameter_tables = {}
+    task_defs = [
+        thaw(task_def) for task_def in iter_task_defs_for_launches(
+            parameter_tables=parameter_tables, launch_names=launch_names, **compile_worker_arguments
+        )
+    ]
+    return task_defs, thaw(parameter_tables)
+
+
+def compile_launches_in_parallel(
+        manifest, puppet_account_id, should_use_sns, should_use_product_plans, include_expanded_from=False,
+        manifest_index=None, max_workers=4
+):
+    if manifest_index is None:
+        manifest_index = build_manifest_index(manifest)
+    launch_names = list(manifest.get('launches', {}).keys())
+    chunk_size = max(1, -(-len(launch_names) // (max_workers * 4)))
+    chunks = [launch_names[i:i + chunk_size] for i in range(0, len(launch_names), chunk_size)]
+    logger.info(f"Compiling {len(launch_names)} launches in {len(chunks)} chunks using {max_workers} processes")
+
+    arguments = {
+        'manifest': manifest,
+        'puppet_account_id': puppet_account_id,
+        'should_use_sns': should_use_sns,
+        'should_use_product_plans': should_use_product_plans,
+        'include_expanded_from': include_expanded_from,
+        'manifest_index': manifest_index,
+        'dependency_index': build_dependency_index(iter_launch_keys(manifest, manifest_index)),
+    }
     task_defs = []
-    accounts = manifest.get('accounts', [])
-    actions = manifest.get('actions', {})
+    parameter_tables = {}
+    with ProcessPoolExecutor(
+            max_workers=max_workers, initializer=init_compile_worker, initargs=(arguments,)
+    ) as executor:
+        for chunk_task_defs, chunk_parameter_tables in executor.map(compile_launches_in_worker, chunks):
+            task_defs += chunk_task_defs
+            for parameters_id, parameters in chunk_parameter_tables.items():
+                parameter_tables.setdefault(parameters_id, parameters)
+    return freeze_compiled(task_defs, parameter_tables)
+
+
+def get_launch_names_by_fragment(manifest):
+    launches = manifest.get('launches', {})
+    launch_names_by_fragment = {}
+    launch_names_in_fragments = set()
+    for include, fragment in manifest.get('fragments', {}).items():
+        launch_names_by_fragment[include] = [
+            launch_name for launch_name in fragment.get('launches', []) if launch_name in launches
+        ]
+        launch_names_in_fragments.update(launch_names_by_fragment[include])
+    launch_names_by_fragment[None] = [
+        launch_name for launch_name in launches.keys() if launch_name not in launch_names_in_fragments
+    ]
+    return launch_names_by_fragment
+
+
+def get_fragment_key_for(manifest, launch_names, launch_keys_by_name, inputs):
+    launches = manifest.get('launches', {})
+    dependencies = {}
+    for launch_name in launch_names:
+        for depends_on in launches.get(launch_name).get('depends_on', []):
+            depends_on_launch_name, _ = get_name_and_scope_for(depends_on)
+            dependencies[depends_on_launch_name] = {
+                'keys': launch_keys_by_name.get(depends_on_launch_name, []),
+                'status': launches.get(depends_on_launch_name, {}).get('status'),
+            }
+    return get_compiled_key_for(
+        json.dumps({launch_name: launches.get(launch_name) for launch_name in launch_names}, default=str),
+        {
+            'accounts': manifest.get('accounts', []),
+            'parameters': manifest.get('parameters', {}),
+            'actions': manifest.get('actions', {}),
+            'configuration': manifest.get('configuration', {}),
+            'dependencies': dependencies,
+            'inputs': inputs,
+        },
+    )
+
+
+def compile_launches_by_fragment(
+        manifest, puppet_account_id, should_use_sns, should_use_product_plans, include_expanded_from=False,
+        manifest_index=None, cache=None, inputs=None
+):
+    if manifest_index is None:
+        manifest_index = build_manifest_index(manifest)
+    if cache is None:
+        cache = {}
+    launch_keys = list(iter_launch_keys(manifest, manifest_index))
+    dependency_index = build_dependency_index(launch_keys)
+    launch_keys_by_name = {}
+    for key in launch_keys:
+        launch_keys_by_name.setdefault(key[0], []).append(key)
+    inputs = {
+        **(inputs or {}),
+        'puppet_account_id': puppet_account_id,
+        'should_use_sns': should_use_sns,
+        'should_use_product_plans': should_use_product_plans,
+        'include_expanded_from': include_expanded_from,
+    }
+
+    task_defs_by_launch_name = {}
+    parameter_tables = {}
+    new_cache = {}
+    for include, launch_names in get_launch_names_by_fragment(manifest).items():
+        fragment_key = get_fragment_key_for(manifest, launch_names, launch_keys_by_name, inputs)
+        fragment_compiled = cache.get(fragment_key)
+        if fragment_compiled is None:
+            logger.info(f"Compiling the launches in {include or 'the manifest'}")
+            fragment_parameter_tables = {}
+            fragment_compiled = {
+                'task_defs': [
+                    thaw(task_def) for task_def in iter_task_defs_for_launches(
+                        manifest, puppet_account_id, should_use_sns, should_use_product_plans,
+                        include_expanded_from, manifest_index, fragment_parameter_tables, launch_names,
+                        dependency_index,
+                    )
+                ],
+                'parameter_tables': thaw(fragment_parameter_tables),
+            }
+        else:
+            logger.info(f"Using the compiled launches for {include or 'the manifest'}")
+        new_cache[fragment_key] = fragment_compiled
+        for task_def in fragment_compiled.get('task_defs'):
+            task_defs_by_launch_name.setdefault(task_def.get('launch_name'), []).append(task_def)
+        parameter_tables.update(fragment_compiled.get('parameter_tables'))
+
+    cache.clear()
+    cache.update(new_cache)
+    compiled = freeze_compiled(
+        [
+            task_def
+            for launch_name in manifest.get('launches', {}).keys()
+            for task_def in task_defs_by_launch_name.get(launch_name, [])
+        ],
+        parameter_tables,
+    )
+    get_topological_order_for({
+        get_key_for(task_def): list(task_def.get('dependencies')) for task_def in compiled.get('task_defs')
+    })
+    return compiled
+
+
+def load_fragment_cache(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r') as f:
+        return json.loads(f.read())
+
+
+def save_fragment_cache(path, cache):
+    with open(path, 'w') as f:
+        f.write(json.dumps(cache))
+
+
+def freeze_compiled(task_defs, parameter_tables):
+    interned_parameter_tables = {}
+    return {
+        'task_defs': [TaskDef(**freeze(task_def)) for task_def in task_defs],
+        'parameter_tables': {
+            parameters_id: interned_parameter_tables.setdefault(
+                json.dumps(parameters, sort_keys=True), freeze(parameters)
+            ) for parameters_id, parameters in parameter_tables.items()
+        },
+    }
+
+
+def iter_launch_keys(manifest, manifest_index):
     for launch_name, launch_details in manifest.get('launches', {}).items():
+        for account, regions in get_accounts_for(launch_details.get('deploy_to'), manifest_index):
+            for region in get_regions_for(regions, account, launch_name):
+                yield launch_name, account.get('account_id'), region
+
+
+def get_task_def_for_launch(manifest, launch_name, launch_details, puppet_account_id, should_use_sns,
+                            should_use_product_plans):
+    actions = manifest.get('actions', {})
+    pre_actions = []
+    for provision_action in launch_details.get('pre_actions', []):
+        action = deepcopy(actions.get(provision_action.get('name')))
+        action.update(provision_action)
+        action['source'] = launch_name
+        action['phase'] = 'pre'
+        action['source_type'] = 'launch'
+        pre_actions.append(action)
+
+    post_actions = []
+    for provision_action in launch_details.get('post_actions', []):
+        action = deepcopy(actions.get(provision_action.get('name')))
+        action.update(provision_action)
+        action['source'] = launch_name
+        action['phase'] = 'post'
+        action['source_type'] = 'launch'
+        post_actions.append(action)
+
+    task_def = {
+        'launch_name': launch_name,
+        'portfolio': launch_details.get('portfolio'),
+        'product': launch_details.get('product'),
+        'version': launch_details.get('version'),
+
+        'puppet_account_id': puppet_account_id,
+
+        'parameters': (),
+        'ssm_param_inputs': (),
+
+        'dependencies': (),
+
+        'retry_count': 0,
+        'worker_timeout': launch_details.get('timeoutInSeconds', constants.DEFAULT_TIMEOUT),
+        'ssm_param_outputs': freeze(launch_details.get('outputs', {}).get('ssm', [])),
+        'should_use_sns': should_use_sns,
+        'should_use_product_plans': should_use_product_plans,
+        'requested_priority': 0,
+
+        'status': launch_details.get('status', constants.PROVISIONED),
+
+        'pre_actions': freeze(pre_actions),
+        'post_actions': freeze(post_actions),
+    }
+
+    if manifest.get('configuration'):
+        if manifest.get('configuration').get('retry_count'):
+            task_def['retry_count'] = manifest.get('configuration').get('retry_count')
+    if launch_details.get('configuration'):
+        if launch_details.get('configuration').get('retry_count'):
+            task_def['retry_count'] = launch_details.get('configuration').get('retry_count')
+        if launch_details.get('configuration').get('requested_priority'):
+            task_def['requested_priority'] = int(launch_details.get('configuration').get('requested_priority'))
+
+    return task_def
+
+
+def iter_task_defs_for_launches(
+        manifest, puppet_account_id, should_use_sns, should_use_product_plans, include_expanded_from=False,
+        manifest_index=None, parameter_tables=None, launch_names=None, dependency_index=None
+):
+    # only the launch keys are held in memory, cycles are checked by compile_launches
+    if manifest_index is None:
+        manifest_index = build_manifest_index(manifest)
+    if parameter_tables is None:
+        parameter_tables = {}
+    launches = manifest.get('launches', {})
+    if launch_names is None:
+        launch_names = launches.keys()
+    if dependency_index is None:
+        dependency_index = build_dependency_index(iter_launch_keys(manifest, manifest_index))
+    interned_parameter_tables = {}
+
+    for launch_name in launch_names:
+        launch_details = launches.get(launch_name)
         logger.info(f"looking at {launch_name}")
-        pre_actions = []
-        for provision_action in launch_details.get('pre_actions', []):
-            action = deepcopy(actions.get(provision_action.get('name')))
-            action.update(provision_action)
-            action['source'] = launch_name
-            action['phase'] = 'pre'
-            action['source_type'] = 'launch'
-            pre_actions.append(action)
+        task_def = get_task_def_for_launch(
+            manifest, launch_name, launch_details, puppet_account_id, should_use_sns, should_use_product_plans
+        )
 
-        post_actions = []
-        for provision_action in launch_details.get('post_actions', []):
-            action = deepcopy(actions.get(provision_action.get('name')))
-            action.update(provision_action)
-            action['source'] = launch_name
-            action['phase'] = 'post'
-            action['source_type'] = 'launch'
-            post_actions.append(action)
+        for account, regions in get_accounts_for(launch_details.get('deploy_to'), manifest_index):
+            account_id = account.get('account_id')
+            parameters_id = get_parameters_id_for(launch_name, account_id)
+            if parameters_id not in parameter_tables:
+                parameters = merge_parameters(
+                    manifest.get('parameters', {}), launch_details.get('parameters', {}), account.get('parameters', {})
+                )
+                parameter_tables[parameters_id] = interned_parameter_tables.setdefault(
+                    json.dumps(parameters, sort_keys=True, default=thaw), parameters
+                )
+            account_def = {
+                **task_def,
+                'account_id': account_id,
+                'parameters_id': parameters_id,
+            }
+            if include_expanded_from:
+                account_def['expanded_from'] = account.get('expanded_from')
 
-        task_def = {
-            'launch_name': launch_name,
-            'portfolio': launch_details.get('portfolio'),
-            'product': launch_details.get('product'),
-            'version': launch_details.get('version'),
+            for region in get_regions_for(regions, account, launch_name):
+                dependencies = []
+                for depends_on in launch_details.get('depends_on', []):
+                    for dependency_key in get_dependency_keys_for(depends_on, account_id, region, dependency_index):
+                        if task_def.get('status') != constants.TERMINATED and \
+                                launches.get(dependency_key[0]).get('status') == constants.TERMINATED:
+                            raise Exception(
+                                f"Launch {launch_name} depends on {dependency_key[0]} which is "
+                                f"{constants.TERMINATED}, this is unsupported"
+                            )
+                        dependencies.append(dependency_key)
+                yield TaskDef(**{**account_def, 'region': region, 'dependencies': tuple(dependencies)})
 
-            'puppet_account_id': puppet_account_id,
 
-            'parameters': [],
-            'ssm_param_inputs': [],
-            'launch_parameters': launch_details.get('parameters', {}),
-            'manifest_parameters': manifest.get('parameters', {}),
+def select_launches(compiled, manifest, manifest_index, filters):
+    task_defs = compiled.get('task_defs')
+    if filters is None:
+        return task_defs
 
-            'depends_on': launch_details.get('depends_on', []),
-            'dependencies': [],
+    edges = {get_key_for(task_def): task_def.get('dependencies') for task_def in task_defs}
+    dependency_index = build_dependency_index(edges.keys())
+    selected_keys = [
+        get_key_for(task_def) for task_def in task_defs if matches_filters(
+            filters,
+            task_def.get('launch_name'),
+            task_def.get('portfolio'),
+            manifest_index.get('accounts_by_id').get(task_def.get('account_id')),
+            task_def.get('region'),
+        )
+    ]
+    selected_keys += get_launch_keys_needed_by_spoke_local_portfolios(
+        manifest, manifest_index, filters, dependency_index
+    )
+    selected_keys = get_transitive_closure_for(edges, selected_keys)
+    task_defs = [task_def for task_def in task_defs if get_key_for(task_def) in selected_keys]
+    logger.info(f"Selected {len(task_defs)} launch tasks using the filters: {filters}")
+    return task_defs
 
-            'retry_count': 0,
-            'worker_timeout': launch_details.get('timeoutInSeconds', constants.DEFAULT_TIMEOUT),
-            'ssm_param_outputs': launch_details.get('outputs', {}).get('ssm', []),
-            'should_use_sns': should_use_sns,
-            'should_use_product_plans': should_use_product_plans,
-            'requested_priority': 0,
 
-            'status': launch_details.get('status', constants.PROVISIONED),
+def get_changed_launch_keys(previous_compiled, compiled):
+    previous_task_defs = {get_key_for(task_def): task_def for task_def in previous_compiled.get('task_defs')}
+    previous_parameter_tables = previous_compiled.get('parameter_tables')
+    parameter_tables = compiled.get('parameter_tables')
 
-            'pre_actions': pre_actions,
-            'post_actions': post_actions,
-        }
+    changed_keys = []
+    current_keys = set()
+    for task_def in compiled.get('task_defs'):
+        key = get_key_for(task_def)
+        current_keys.add(key)
+        previous_task_def = previous_task_defs.get(key)
+        if previous_task_def is None:
+            changed_keys.append(key)
+        elif {k: v for k, v in previous_task_def.items() if k != 'parameters_id'} != \
+                {k: v for k, v in task_def.items() if k != 'parameters_id'}:
+            changed_keys.append(key)
+        elif previous_parameter_tables.get(previous_task_def.get('parameters_id')) != \
+                parameter_tables.get(task_def.get('parameters_id')):
+            changed_keys.append(key)
 
-        if manifest.get('configuration'):
-            if manifest.get('configuration').get('retry_count'):
-                task_def['retry_count'] = manifest.get('configuration').get('retry_count')
-        if launch_details.get('configuration'):
-            if launch_details.get('configuration').get('retry_count'):
-                task_def['retry_count'] = launch_details.get('configuration').get('retry_count')
-            if launch_details.get('configuration').get('requested_priority'):
-                task_def['requested_priority'] = int(launch_details.get('configuration').get('requested_priority'))
+    removed_keys = [key for key in previous_task_defs.keys() if key not in current_keys]
+    return changed_keys, removed_keys
 
-        deploy_to = launch_details .get('deploy_to')
-        for tag_list_item in deploy_to.get('tags', []):
-            for account in accounts:
-                for tag in account.get('tags', []):
-                    if tag == tag_list_item.get('tag'):
-                        tag_account_def = deepcopy(task_def)
-                        tag_account_def['account_id'] = account.get('account_id')
-                        if include_expanded_from:
-                            tag_account_def['expanded_from'] = account.get('expanded_from')
-                        tag_account_def['account_parameters'] = account.get('parameters', {})
-
-                        regions = tag_list_item.get('regions')
-                        if isinstance(regions, str):
-                            if regions in ["enabled", "regions_enabled", "enabled_regions"]:
-                                for region_enabled in account.get('regions_enabled'):
-                                    region_tag_account_def = deepcopy(tag_account_def)
-                                    region_tag_account_def['region'] = region_enabled
-                                    task_defs.append(region_tag_account_def)
-                            elif regions == 'default_region':
-                                region_tag_account_def = deepcopy(tag_account_def)
-                                region_tag_account_def['region'] = account.get('default_region')
-                                task_defs.append(region_tag_account_def)
-                            elif regions == "all":
-                                all_regions = config.get_regions()
-                                for region_enabled in all_regions:
-                                    region_tag_account_def = deepcopy(tag_account_def)
-                                    region_tag_account_def['region'] = region_enabled
-                                    task_defs.append(region_tag_account_def)
-                            else:
-                                raise Exception(f"Unsupported regions {regions} setting for launch: {launch_name}")
-                        elif isinstance(regions, list):
-                            for region in regions:
-                                region_tag_account_def = deepcopy(tag_account_def)
-                                region_tag_account_def['region'] = region
-                                task_defs.append(region_tag_account_def)
-                        else:
-                            raise Exception(f"Unexpected regions of {regions} set for launch {launch_name}")
-
-        for account_list_item in deploy_to.get('accounts', []):
-            for account in accounts:
-                if account.get('account_id') == account_list_item.get('account_id'):
-                    account_account_def = deepcopy(task_def)
-                    account_account_def['account_id'] = account.get('account_id')
-                    if include_expanded_from:
-                        account_account_def['expanded_from'] = account.get('expanded_from')
-                    account_account_def['account_parameters'] = account.get('parameters', {})
-
-                    regions = account_list_item.get('regions')
-                    if isinstance(regions, str):
-                        if regions in ["enabled", "regions_enabled", "enabled_regions"]:
-                            for region_enabled in account.get('regions_enabled'):
-                                region_account_account_def = deepcopy(account_account_def)
-                                region_account_account_def['region'] = region_enabled
-                                task_defs.append(region_account_account_def)
-                        elif regions in ["default_region"]:
-                            region_account_account_def = deepcopy(account_account_def)
-                            region_account_account_def['region'] = account.get('default_region')
-                            task_defs.append(region_account_account_def)
-                        elif regions in ["all"]:
-                            all_regions = config.get_regions()
-                            for region_enabled in all_regions:
-                                region_account_account_def = deepcopy(account_account_def)
-                                region_account_account_def['region'] = region_enabled
-                                task_defs.append(region_account_account_def)
-                        else:
-                            raise Exception(f"Unsupported regions {regions} setting for launch: {launch_name}")
-
-                    elif isinstance(regions, list):
-                        for region in regions:
-                            region_account_account_def = deepcopy(account_account_def)
-                            region_account_account_def['region'] = region
-                            task_defs.append(region_account_account_def)
-                    else:
-                        raise Exception(f"Unexpected regions of {regions} set for launch {launch_name}")
 
+def select_changed_launches(task_defs, changed_keys):
+    dependants = {}
     for task_def in task_defs:
-        for depends_on_launch_name in task_def.get('depends_on', []):
-            for task_def_2 in task_defs:
-                if task_def_2.get('launch_name') == depends_on_launch_name:
-                    task_def_2_copy = deepcopy(task_def_2)
-                    del task_def_2_copy['depends_on']
-                    task_def_2_copy['dependencies'] = []
-                    task_def['dependencies'].append(task_def_2_copy)
+        for dependency_key in task_def.get('dependencies'):
+            dependants.setdefault(tuple(dependency_key), []).append(get_key_for(task_def))
+    selected_keys = get_transitive_closure_for(dependants, changed_keys)
 
+    return [
+        TaskDef(**{
+            **task_def,
+            'dependencies': tuple(
+                dependency_key for dependency_key in task_def.get('dependencies')
+                if tuple(dependency_key) in selected_keys
+            ),
+        })
+        for task_def in task_defs if get_key_for(task_def) in selected_keys
+    ]
+
+
+def get_spoke_local_portfolio_definitions(manifest, manifest_index):
+    definitions = {}
+    for launch_name, launch_details in manifest.get(constants.SPOKE_LOCAL_PORTFOLIOS, {}).items():
+        for account, regions in get_accounts_for(launch_details.get('deploy_to'), manifest_index):
+            for region in get_regions_for(regions, account, launch_name):
+                definitions[(launch_name, account.get('account_id'), region)] = json.dumps(
+                    {'launch_details': launch_details, 'account': account, 'actions': manifest.get('actions', {})},
+                    sort_keys=True,
+                    default=str,
+                )
+    return definitions
+
+
+def get_changed_spoke_local_portfolio_keys(previous_manifest, previous_manifest_index, manifest, manifest_index):
+    previous_definitions = get_spoke_local_portfolio_definitions(previous_manifest, previous_manifest_index)
+    return {
+        key for key, definition in get_spoke_local_portfolio_definitions(manifest, manifest_index).items()
+        if previous_definitions.get(key) != definition
+    }
+
+
+def get_compiled_key_for(manifest_content, inputs):
+    digest = hashlib.sha256()
+    digest.update(manifest_content.encode('utf-8') if isinstance(manifest_content, str) else manifest_content)
+    digest.update(json.dumps(inputs, sort_keys=True, default=str).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def save_compiled(path, key, compiled):
+    with open(path, 'w') as f:
+        f.write(json.dumps({
+            'key': key,
+            'task_defs': [thaw(task_def) for task_def in compiled.get('task_defs')],
+            'parameter_tables': thaw(compiled.get('parameter_tables')),
+        }))
+
+
+def load_compiled(path, key):
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r') as f:
+        content = json.loads(f.read())
+    if content.get('key') != key:
+        logger.info(f"{path} was compiled from a different manifest or config, ignoring it")
+        return None
+    return freeze_compiled(content.get('task_defs'), content.get('parameter_tables'))
+
+
+def matches_filters(filters, launch_name, portfolio, account, region):
+    if filters is None:
+        return True
+    if filters.get('launch_name') is not None and filters.get('launch_name') != launch_name:
+        return False
+    if filters.get('portfolio') is not None and filters.get('portfolio') != portfolio:
+        return False
+    if filters.get('account_id') is not None and filters.get('account_id') != account.get('account_id'):
+        return False
+    if filters.get('region') is not None and filters.get('region') != region:
+        return False
+    if filters.get('tag') is not None and filters.get('tag') not in account.get('tags', []):
+        return False
+    return True
+
+
+def get_launch_keys_needed_by_spoke_local_portfolios(manifest, manifest_index, filters, dependency_index):
+    launch_keys = []
+    for launch_name, launch_details in manifest.get(constants.SPOKE_LOCAL_PORTFOLIOS, {}).items():
+        depends_on = launch_details.get('depends_on', [])
+        if len(depends_on) == 0:
+            continue
+        for account, regions in get_accounts_for(launch_details.get('deploy_to'), manifest_index):
+            for region in get_regions_for(regions, account, launch_name):
+                if matches_filters(filters, launch_name, launch_details.get('portfolio'), account, region):
+                    for dependency in depends_on:
+                        launch_keys += get_dependency_keys_for(
+                            dependency, account.get('account_id'), region, dependency_index
+                        )
+    return launch_keys
+
+
+def get_transitive_closure_for(edges, keys):
+    selected = set()
+    keys_to_visit = list(keys)
+    while len(keys_to_visit) > 0:
+        key = keys_to_visit.pop()
+        if key not in selected:
+            selected.add(key)
+            keys_to_visit += edges.get(key, [])
+    return selected
+
+
+def get_key_for(task_def):
+    return task_def.get('launch_name'), task_def.get('account_id'), task_def.get('region')
+
+
+def get_name_and_scope_for(depends_on):
+    if isinstance(depends_on, str):
+        return depends_on, constants.DEFAULT_DEPENDS_ON_SCOPE
+    return depends_on.get('name'), depends_on.get('scope', constants.DEFAULT_DEPENDS_ON_SCOPE)
+
+
+def build_dependency_index(keys):
+    dependency_index = {}
+    for launch_name, account_id, region in keys:
+        key = (launch_name, account_id, region)
+        dependency_index.setdefault(
+            (constants.DEPENDS_ON_SCOPE_GLOBAL, launch_name), []
+        ).append(key)
+        dependency_index.setdefault(
+            (constants.DEPENDS_ON_SCOPE_SAME_ACCOUNT, launch_name, account_id), []
+        ).append(key)
+        dependency_index.setdefault(
+            (constants.DEPENDS_ON_SCOPE_SAME_ACCOUNT_SAME_REGION, launch_name, account_id, region), []
+        ).append(key)
+    return dependency_index
+
+
+def get_dependency_keys_for(depends_on, account_id, region, dependency_index):
+    depends_on_launch_name, scope = get_name_and_scope_for(depends_on)
+    if scope == constants.DEPENDS_ON_SCOPE_GLOBAL:
+        lookup = (scope, depends_on_launch_name)
+    elif scope == constants.DEPENDS_ON_SCOPE_SAME_ACCOUNT:
+        lookup = (scope, depends_on_launch_name, account_id)
+    elif scope == constants.DEPENDS_ON_SCOPE_SAME_ACCOUNT_SAME_REGION:
+        lookup = (scope, depends_on_launch_name, account_id, region)
+    else:
+        raise Exception(f"Unsupported depends_on scope {scope} for: {depends_on_launch_name}")
+    return dependency_index.get(lookup, [])
+
+
+def build_launch_dependency_graph(task_defs):
+    nodes = {}
     for task_def in task_defs:
-        del task_def['depends_on']
+        nodes[get_key_for(task_def)] = task_def
+    dependency_index = build_dependency_index(nodes.keys())
+
+    edges = {}
+    for key, task_def in nodes.items():
+        edges[key] = []
+        for depends_on in task_def.get('depends_on', []):
+            dependency_keys = get_dependency_keys_for(
+                depends_on, task_def.get('account_id'), task_def.get('region'), dependency_index
+            )
+            for dependency_key in dependency_keys:
+                if task_def.get('status') != constants.TERMINATED and \
+                        nodes[dependency_key].get('status') == constants.TERMINATED:
+                    raise Exception(
+                        f"Launch {task_def.get('launch_name')} depends on {dependency_key[0]} which is "
+                        f"{constants.TERMINATED}, this is unsupported"
+                    )
+                edges[key].append(dependency_key)
+
+    return {
+        'nodes': nodes,
+        'edges': edges,
+        'order': get_topological_order_for(edges),
+    }
 
-    return task_defs
+
+def get_topological_order_for(edges):
+    number_of_dependencies = {key: len(set(dependency_keys)) for key, dependency_keys in edges.items()}
+    dependants = {key: [] for key in edges.keys()}
+    for key, dependency_keys in edges.items():
+        for dependency_key in set(dependency_keys):
+            dependants[dependency_key].append(key)
+
+    order = [key for key, count in number_of_dependencies.items() if count == 0]
+    for key in order:
+        for dependant_key in dependants[key]:
+            number_of_dependencies[dependant_key] -= 1
+            if number_of_dependencies[dependant_key] == 0:
+                order.append(dependant_key)
+
+    if len(order) != len(edges):
+        in_cycle = sorted({key[0] for key, count in number_of_dependencies.items() if count > 0})
+        raise Exception(f"Launches have a cyclic dependency: {', '.join(in_cycle)}")
+
+    return order
 
 
 def convert_manifest_into_task_defs_for_spoke_local_portfolios_in(
         account_id, expanded_from, organization, region, launch_details,
-        puppet_account_id, should_use_sns, launch_tasks, pre_actions, post_actions
+        puppet_account_id, should_use_sns, launch_dependency_index, pre_actions, post_actions, hub_portfolios
 ):
     dependencies = []
-    for depend in launch_details.get('depends_on', []):
-        for launch_task in launch_tasks:
-            if isinstance(launch_task, provisioning.ProvisionProductTask):
-                l_params = launch_task.to_str_params()
-                if l_params.get('launch_name') == depend:
-                    dependencies.append(launch_task.param_kwargs)
-    hub_portfolio = aws.get_portfolio_for(
-        launch_details.get('portfolio'), puppet_account_id, region
-    )
+    for depends_on in launch_details.get('depends_on', []):
+        for launch_key in get_dependency_keys_for(depends_on, account_id, region, launch_dependency_index):
+            dependencies.append(list(launch_key))
+    hub_portfolio = get_hub_portfolio_for(launch_details.get('portfolio'), puppet_account_id, region, hub_portfolios)
     tasks_to_run = []
     create_spoke_local_portfolio_task_params = {
         'account_id': account_id,
@@ -355,11 +986,47 @@ def convert_manifest_into_task_defs_for_spoke_local_portfolios_in(
     return tasks_to_run
 
 
-def convert_manifest_into_task_defs_for_spoke_local_portfolios(manifest, puppet_account_id, should_use_sns, launch_tasks):
+def get_hub_portfolio_for(portfolio, puppet_account_id, region, hub_portfolios):
+    if (portfolio, region) not in hub_portfolios:
+        hub_portfolios[(portfolio, region)] = aws.get_portfolio_for(portfolio, puppet_account_id, region)
+    return hub_portfolios[(portfolio, region)]
+
+
+def prefetch_hub_portfolios(manifest, puppet_account_id, manifest_index=None, max_workers=10, filters=None):
+    if manifest_index is None:
+        manifest_index = build_manifest_index(manifest)
+    lookups = set()
+    for launch_name, launch_details in manifest.get(constants.SPOKE_LOCAL_PORTFOLIOS, {}).items():
+        for account, regions in get_accounts_for(launch_details.get('deploy_to'), manifest_index):
+            for region in get_regions_for(regions, account, launch_name):
+                if matches_filters(filters, launch_name, launch_details.get('portfolio'), account, region):
+                    lookups.add((launch_details.get('portfolio'), region))
+
+    logger.info(f"Prefetching {len(lookups)} hub portfolios")
+    lookups = sorted(lookups)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        portfolios = executor.map(
+            lambda lookup: aws.get_portfolio_for(lookup[0], puppet_account_id, lookup[1]), lookups
+        )
+        return dict(zip(lookups, portfolios))
+
+
+def convert_manifest_into_task_defs_for_spoke_local_portfolios(
+        manifest, puppet_account_id, should_use_sns, launch_tasks, manifest_index=None, hub_portfolios=None,
+        filters=None, changed_keys=None
+):
     tasks = []
-    accounts = manifest.get('accounts', [])
+    if manifest_index is None:
+        manifest_index = build_manifest_index(manifest)
+    if hub_portfolios is None:
+        hub_portfolios = prefetch_hub_portfolios(manifest, puppet_account_id, manifest_index, filters=filters)
     actions = manifest.get('actions', {})
 
+    launch_dependency_index = build_dependency_index([
+        (launch_task.launch_name, launch_task.account_id, launch_task.region)
+        for launch_task in launch_tasks if isinstance(launch_task, provisioning.ProvisionProductTask)
+    ])
+
     for launch_name, launch_details in manifest.get('spoke-local-portfolios', {}).items():
         logger.info(f"Looking at {launch_name}")
         pre_actions = []
@@ -381,12 +1048,13 @@ def convert_manifest_into_task_defs_for_spoke_local_portfolios(manifest, puppet_
             post_actions.append(action)
 
         task_def = {
-            'launch_tasks': launch_tasks,
+            'launch_dependency_index': launch_dependency_index,
             'launch_details': launch_details,
             'puppet_account_id': puppet_account_id,
             'should_use_sns': should_use_sns,
             'pre_actions': pre_actions,
             'post_actions': post_actions,
+            'hub_portfolios': hub_portfolios,
         }
 
         if manifest.get('configuration'):
@@ -398,94 +1066,31 @@ def convert_manifest_into_task_defs_for_spoke_local_portfolios(manifest, puppet_
             if launch_details.get('configuration').get('requested_priority'):
                 task_def['requested_priority'] = int(launch_details.get('configuration').get('requested_priority'))
 
-        deploy_to = launch_details .get('deploy_to')
-        for tag_list_item in deploy_to.get('tags', []):
-            for account in accounts:
-                for tag in account.get('tags', []):
-                    if tag == tag_list_item.get('tag'):
-                        tag_account_def = deepcopy(task_def)
-                        tag_account_def['account_id'] = account.get('account_id')
-                        tag_account_def['expanded_from'] = account.get('expanded_from')
-                        tag_account_def['organization'] = account.get('organization')
-
-                        regions = tag_list_item.get('regions')
-                        if isinstance(regions, str):
-                            if regions in ["enabled", "regions_enabled", "enabled_regions"]:
-                                for region_enabled in account.get('regions_enabled'):
-                                    region_tag_account_def = deepcopy(tag_account_def)
-                                    region_tag_account_def['region'] = region_enabled
-                                    tasks += convert_manifest_into_task_defs_for_spoke_local_portfolios_in(
-                                        **region_tag_account_def
-                                    )
-                            elif regions == 'default_region':
-                                region_tag_account_def = deepcopy(tag_account_def)
-                                region_tag_account_def['region'] = account.get('default_region')
-                                tasks += convert_manifest_into_task_defs_for_spoke_local_portfolios_in(
-                                    **region_tag_account_def
-                                )
-                            elif regions == "all":
-                                all_regions = config.get_regions()
-                                for region_enabled in all_regions:
-                                    region_tag_account_def = deepcopy(tag_account_def)
-                                    region_tag_account_def['region'] = region_enabled
-                                    tasks += convert_manifest_into_task_defs_for_spoke_local_portfolios_in(
-                                        **region_tag_account_def
-                                    )
-                            else:
-                                raise Exception(f"Unsupported regions {regions} setting for launch: {launch_name}")
-                        elif isinstance(regions, list):
-                            for region in regions:
-                                region_tag_account_def = deepcopy(tag_account_def)
-                                region_tag_account_def['region'] = region
-                                tasks += convert_manifest_into_task_defs_for_spoke_local_portfolios_in(
-                                    **region_tag_account_def
-                                )
-                        else:
-                            raise Exception(f"Unexpected regions of {regions} set for launch {launch_name}")
-
-        for account_list_item in deploy_to.get('accounts', []):
-            for account in accounts:
-                if account.get('account_id') == account_list_item.get('account_id'):
-                    account_account_def = deepcopy(task_def)
-                    account_account_def['account_id'] = account.get('account_id')
-                    account_account_def['expanded_from'] = account.get('expanded_from')
-                    account_account_def['organization'] = account.get('organization')
-                    # account_account_def['account_parameters'] = account.get('parameters', {})
-
-                    regions = account_list_item.get('regions')
-                    if isinstance(regions, str):
-                        if regions in ["enabled", "regions_enabled", "enabled_regions"]:
-                            for region_enabled in account.get('regions_enabled'):
-                                region_account_account_def = deepcopy(account_account_def)
-                                region_account_account_def['region'] = region_enabled
-                                tasks += convert_manifest_into_task_defs_for_spoke_local_portfolios_in(
-                                    **region_account_account_def
-                                )
-                        elif regions == 'default_region':
-                            region_account_account_def = deepcopy(account_account_def)
-                            region_account_account_def['region'] = account.get('default_region')
-                            tasks += convert_manifest_into_task_defs_for_spoke_local_portfolios_in(
-                                **region_account_account_def
-                            )
-                        elif regions == "all":
-                            all_regions = config.get_regions()
-                            for region_enabled in all_regions:
-                                region_account_account_def = deepcopy(account_account_def)
-                                region_account_account_def['region'] = region_enabled
-                                tasks += convert_manifest_into_task_defs_for_spoke_local_portfolios_in(
-                                    **region_account_account_def
-                                )
-                        else:
-                            raise Exception(f"Unsupported regions {regions} setting for launch: {launch_name}")
-
-                    elif isinstance(regions, list):
-                        for region in regions:
-                            region_account_account_def = deepcopy(account_account_def)
-                            region_account_account_def['region'] = region
-                            tasks += convert_manifest_into_task_defs_for_spoke_local_portfolios_in(
-                                **region_account_account_def
-                            )
-                    else:
-                        raise Exception(f"Unexpected regions of {regions} set for launch {launch_name}")
+        deploy_to = launch_details.get('deploy_to')
+        for account, regions in get_accounts_for(deploy_to, manifest_index):
+            account_def = {
+                **task_def,
+                'account_id': account.get('account_id'),
+                'expanded_from': account.get('expanded_from'),
+                'organization': account.get('organization'),
+            }
+
+            for region in get_regions_for(regions, account, launch_name):
+                if not matches_filters(filters, launch_name, launch_details.get('portfolio'), account, region):
+                    continue
+                if changed_keys is not None and (launch_name, account.get('account_id'), region) not in changed_keys:
+                    dependency_keys = [
+                        dependency_key
+                        for depends_on in launch_details.get('depends_on', [])
+                        for dependency_key in get_dependency_keys_for(
+                            depends_on, account.get('account_id'), region, launch_dependency_index
+                        )
+                    ]
+                    if len(dependency_keys) == 0:
+                        continue
+                region_account_def = {**account_def, 'region': region}
+                tasks += convert_manifest_into_task_defs_for_spoke_local_portfolios_in(
+                    **region_account_def
+                )
 
     return tasks
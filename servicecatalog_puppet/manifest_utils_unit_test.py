@@ -12,7 +12,8 @@ def sut():
     return manifest_utils
 
 
-def test_convert_manifest_into_task_defs(sut, shared_datadir):
+@pytest.mark.parametrize("max_workers", [None, 2])
+def test_convert_manifest_into_task_defs(sut, max_workers, shared_datadir):
     # setup
     manifest = json.loads((shared_datadir / 'account-vending' / 'manifest.json').read_text())
     puppet_account_id = 9
@@ -22,11 +23,11 @@ def test_convert_manifest_into_task_defs(sut, shared_datadir):
 
     # execute
     actual_result = sut.convert_manifest_into_task_defs_for_launches(
-        manifest, puppet_account_id, should_use_sns, should_use_product_plans
+        manifest, puppet_account_id, should_use_sns, should_use_product_plans, max_workers=max_workers
     )
 
     # verify
-    assert actual_result == expected_result
+    assert sut.thaw(actual_result) == expected_result
     assert len(actual_result) == len(expected_result)
 
 
@@ -47,7 +48,9 @@ def test_convert_manifest_into_task_defs(sut, shared_datadir):
     ]
 )
 
-def test_convert_manifest_into_task_defs_handles_default_region(sut, shared_datadir, dir, manifest_file):
+@pytest.mark.parametrize("max_workers", [None, 2])
+def test_convert_manifest_into_task_defs_handles_default_region(sut, shared_datadir, dir, manifest_file,
+                                                                max_workers):
     # setup
     manifest = yaml.safe_load(
         (shared_datadir / 'manifest_utils' / dir / f"{manifest_file}.yaml").read_text()
@@ -61,11 +64,11 @@ def test_convert_manifest_into_task_defs_handles_default_region(sut, shared_data
 
     # exercise
     actual_result = sut.convert_manifest_into_task_defs_for_launches(
-        manifest, puppet_account_id, should_use_sns, should_use_product_plans
+        manifest, puppet_account_id, should_use_sns, should_use_product_plans, max_workers=max_workers
     )
 
     # verify
-    assert expected_result == actual_result
+    assert expected_result == sut.thaw(actual_result)
 
 
 @pytest.mark.parametrize(
@@ -76,8 +79,9 @@ def test_convert_manifest_into_task_defs_handles_default_region(sut, shared_data
         ('accounts', 'test_convert_manifest_into_task_defs_handles_all'),
     ]
 )
+@pytest.mark.parametrize("max_workers", [None, 2])
 def test_convert_manifest_into_task_defs_handles_default_region_for_all(sut, mocker, shared_datadir, dir,
-                                                                        manifest_file):
+                                                                        manifest_file, max_workers):
     # setup
     manifest = yaml.safe_load(
         (shared_datadir / 'manifest_utils' / dir / f"{manifest_file}.yaml").read_text()
@@ -95,11 +99,11 @@ def test_convert_manifest_into_task_defs_handles_default_region_for_all(sut, moc
 
     # exercise
     actual_result = sut.convert_manifest_into_task_defs_for_launches(
-        manifest, puppet_account_id, should_use_sns, should_use_product_plans
+        manifest, puppet_account_id, should_use_sns, should_use_product_plans, max_workers=max_workers
     )
 
     # verify
-    assert expected_result == actual_result
+    assert expected_result == sut.thaw(actual_result)
 
 
 @pytest.mark.parametrize(
@@ -110,7 +114,9 @@ def test_convert_manifest_into_task_defs_handles_default_region_for_all(sut, moc
         ('accounts', 'test_convert_manifest_into_task_defs_handles_unsupported_string'),
     ]
 )
-def test_convert_manifest_into_task_defs_handles_for_unsupported_string(sut, shared_datadir, dir, manifest_file):
+@pytest.mark.parametrize("max_workers", [None, 2])
+def test_convert_manifest_into_task_defs_handles_for_unsupported_string(sut, shared_datadir, dir, manifest_file,
+                                                                        max_workers):
     # setup
     manifest = yaml.safe_load(
         (shared_datadir / 'manifest_utils' / dir / f"{manifest_file}.yaml").read_text()
@@ -122,7 +128,7 @@ def test_convert_manifest_into_task_defs_handles_for_unsupported_string(sut, sha
     # exercise
     with pytest.raises(Exception) as e:
         sut.convert_manifest_into_task_defs_for_launches(
-            manifest, puppet_account_id, should_use_sns, should_use_product_plans
+            manifest, puppet_account_id, should_use_sns, should_use_product_plans, max_workers=max_workers
         )
 
     # verify
@@ -135,7 +141,9 @@ def test_convert_manifest_into_task_defs_handles_for_unsupported_string(sut, sha
         'test_convert_manifest_into_task_defs_handles_depends_on_without-leaks',
     ]
 )
-def test_convert_manifest_into_task_defs_handles_transient_dependencies(sut, shared_datadir, manifest_file, mocker):
+@pytest.mark.parametrize("max_workers", [None, 2])
+def test_convert_manifest_into_task_defs_handles_transient_dependencies(sut, shared_datadir, manifest_file, mocker,
+                                                                        max_workers):
     # setup
     manifest = yaml.safe_load(
         (shared_datadir / 'manifest_utils' / f"{manifest_file}.yaml").read_text()
@@ -154,7 +162,7 @@ def test_convert_manifest_into_task_defs_handles_transient_dependencies(sut, sha
 
     # exercise
     actual_result = sut.convert_manifest_into_task_defs_for_launches(
-        manifest, puppet_account_id, should_use_sns, should_use_product_plans
+        manifest, puppet_account_id, should_use_sns, should_use_product_plans, max_workers=max_workers
     )
 
     # verify
@@ -162,10 +170,419 @@ def test_convert_manifest_into_task_defs_handles_transient_dependencies(sut, sha
         launch_name = task_def.get('launch_name')
         if launch_name == 'assumable-role-account-child':
             dependencies = task_def.get('dependencies')
-            assert len(dependencies) == 1
-            transient_dependencies = dependencies[0].get('dependencies')
-            assert len(transient_dependencies) == 0
+            assert dependencies == (('assumable-role-account-parent', '246919575282', 'eu-west-3'),)
             verified = True
 
     assert verified
-    assert actual_result == expected_result
+    assert sut.thaw(actual_result) == expected_result
+
+
+def test_convert_manifest_into_task_defs_shares_frozen_sub_objects(sut, mocker):
+    # setup
+    mocker.patch.object(sut.workflow_tasks, 'parameter_tables', {})
+    manifest = {
+        'accounts': [
+            {'account_id': '1', 'tags': ['type:prod'], 'parameters': {'a': {'default': 'b'}}},
+            {'account_id': '2', 'tags': ['type:prod']},
+            {'account_id': '3', 'tags': ['type:prod']},
+        ],
+        'parameters': {'a': {'default': 'z'}, 'c': {'default': 'd'}},
+        'launches': {
+            'launch-a': {
+                'portfolio': 'portfolio-a',
+                'product': 'product-a',
+                'version': 'v1',
+                'parameters': {'c': {'ssm': {'name': 'e'}, 'default': 'f'}},
+                'deploy_to': {'tags': [{'tag': 'type:prod', 'regions': ['eu-west-1', 'eu-west-2']}]},
+            },
+        },
+    }
+
+    # exercise
+    actual_result = sut.convert_manifest_into_task_defs_for_launches(manifest, 9, True, True)
+
+    # verify
+    assert len(actual_result) == 6
+    first, second = actual_result[0], actual_result[1]
+    assert first.get('parameters_id') == second.get('parameters_id') == 'launch-a/1'
+    assert sut.thaw(sut.workflow_tasks.get_registered_parameters('launch-a/1')) == {
+        'a': {'default': 'b'},
+        'c': {'ssm': {'name': 'e'}},
+    }
+    assert sut.workflow_tasks.get_registered_parameters('launch-a/2') is \
+        sut.workflow_tasks.get_registered_parameters('launch-a/3')
+    assert first.get('pre_actions') is actual_result[5].get('pre_actions')
+    with pytest.raises(TypeError):
+        first['region'] = 'eu-west-3'
+    with pytest.raises(TypeError):
+        first.region = 'eu-west-3'
+    with pytest.raises(TypeError):
+        sut.workflow_tasks.get_registered_parameters('launch-a/1')['a'] = {}
+
+
+def test_expand_ou_uses_the_account_index(sut, mocker):
+    # setup
+    client = mocker.Mock()
+    client.list_accounts_single_page.return_value = {
+        'Accounts': [
+            {
+                'Id': '1', 'Name': 'one', 'Email': 'one@example.com', 'Status': 'ACTIVE',
+                'Arn': 'arn:aws:organizations::0:account/o-abc/1',
+            },
+            {
+                'Id': '2', 'Name': 'two', 'Email': 'two@example.com', 'Status': 'SUSPENDED',
+                'Arn': 'arn:aws:organizations::0:account/o-abc/2',
+            },
+            {
+                'Id': '3', 'Name': 'three', 'Email': 'three@example.com', 'Status': 'ACTIVE',
+                'Arn': 'arn:aws:organizations::0:account/o-abc/3',
+            },
+        ]
+    }
+    ou_tree = {
+        'ous': {'ou-abc': {'id': 'ou-abc', 'path': '/abc', 'accounts': ['1', '2', '3'], 'children': []}},
+        'paths': {'/abc': 'ou-abc'},
+    }
+    original_account = {'ou': 'ou-abc', 'exclude': {'accounts': ['3']}, 'tags': ['type:prod']}
+    account_index = sut.organizations.build_account_index(client)
+
+    # exercise
+    actual_result = sut.expand_ou(original_account, client, account_index, ou_tree)
+
+    # verify
+    assert actual_result == [
+        {
+            'exclude': {'accounts': ['3']},
+            'tags': ['type:prod'],
+            'name': 'one',
+            'email': 'one@example.com',
+            'account_id': '1',
+            'expanded_from': 'ou-abc',
+            'organization': 'o-abc',
+        }
+    ]
+    client.describe_account.assert_not_called()
+
+
+def test_expand_manifest_reports_every_duplicate_account(sut, mocker):
+    # setup
+    manifest = {
+        'accounts': [
+            {'account_id': '1'},
+            {'ou': 'ou-a'},
+            {'ou': 'ou-b'},
+        ]
+    }
+    snapshot = {
+        'accounts': {
+            account_id: {
+                'Id': account_id, 'Status': 'ACTIVE', 'Arn': f"arn:aws:organizations::0:account/o-abc/{account_id}",
+            } for account_id in ['1', '2', '3']
+        },
+        'ou_tree': {
+            'ous': {
+                'ou-a': {'id': 'ou-a', 'accounts': ['1', '2'], 'children': []},
+                'ou-b': {'id': 'ou-b', 'accounts': ['1', '2', '3'], 'children': []},
+            },
+            'paths': {},
+        },
+    }
+
+    # exercise
+    with pytest.raises(Exception) as e:
+        sut.expand_manifest(manifest, mocker.Mock(), snapshot)
+
+    # verify
+    assert str(e.value) == "\n".join([
+        "1 has been seen 3 times.  It was included by its account_id"
+        "  It was included due to it being in the ou: ou-a  It was included due to it being in the ou: ou-b",
+        "2 has been seen 2 times."
+        "  It was included due to it being in the ou: ou-a  It was included due to it being in the ou: ou-b",
+    ])
+
+
+def test_prefetch_hub_portfolios_looks_up_each_portfolio_and_region_once(sut, mocker):
+    # setup
+    mocked_get_portfolio_for = mocker.patch.object(sut.aws, 'get_portfolio_for')
+    mocked_get_portfolio_for.side_effect = lambda portfolio, account_id, region: {'Id': f"{portfolio}-{region}"}
+    manifest = {
+        'accounts': [
+            {'account_id': '1', 'tags': ['type:prod']},
+            {'account_id': '2', 'tags': ['type:prod']},
+        ],
+        'spoke-local-portfolios': {
+            'spoke-a': {
+                'portfolio': 'portfolio-a',
+                'deploy_to': {'tags': [{'tag': 'type:prod', 'regions': ['eu-west-1', 'eu-west-2']}]},
+            },
+        },
+    }
+
+    # exercise
+    actual_result = sut.prefetch_hub_portfolios(manifest, '9')
+
+    # verify
+    assert actual_result == {
+        ('portfolio-a', 'eu-west-1'): {'Id': 'portfolio-a-eu-west-1'},
+        ('portfolio-a', 'eu-west-2'): {'Id': 'portfolio-a-eu-west-2'},
+    }
+    assert mocked_get_portfolio_for.call_count == 2
+
+
+def test_convert_manifest_into_task_defs_only_compiles_the_filtered_subgraph(sut, mocker):
+    # setup
+    mocker.patch.object(sut.workflow_tasks, 'parameter_tables', {})
+    manifest = {
+        'accounts': [
+            {'account_id': '1', 'tags': ['type:prod']},
+            {'account_id': '2', 'tags': ['type:prod']},
+            {'account_id': '3', 'tags': ['type:hub']},
+        ],
+        'launches': {
+            'hub': {
+                'portfolio': 'portfolio-a', 'product': 'hub', 'version': 'v1',
+                'deploy_to': {'tags': [{'tag': 'type:hub', 'regions': ['eu-west-1']}]},
+            },
+            'spoke': {
+                'portfolio': 'portfolio-a', 'product': 'spoke', 'version': 'v1',
+                'depends_on': [{'name': 'hub', 'scope': 'global'}],
+                'deploy_to': {'tags': [{'tag': 'type:prod', 'regions': ['eu-west-1']}]},
+            },
+            'other': {
+                'portfolio': 'portfolio-b', 'product': 'other', 'version': 'v1',
+                'deploy_to': {'tags': [{'tag': 'type:prod', 'regions': ['eu-west-1']}]},
+            },
+        },
+    }
+    filters = {'account_id': '2', 'launch_name': 'spoke'}
+
+    # exercise
+    actual_result = sut.convert_manifest_into_task_defs_for_launches(manifest, 9, True, True, filters=filters)
+
+    # verify
+    assert sorted(sut.get_key_for(task_def) for task_def in actual_result) == [
+        ('hub', '3', 'eu-west-1'),
+        ('spoke', '2', 'eu-west-1'),
+    ]
+    assert sorted(sut.workflow_tasks.parameter_tables.keys()) == ['hub/3', 'spoke/2']
+
+
+def test_save_and_load_compiled(sut, shared_datadir, tmp_path):
+    # setup
+    manifest = json.loads((shared_datadir / 'account-vending' / 'manifest.json').read_text())
+    compiled = sut.compile_launches(manifest, 9, True, True)
+    path = tmp_path / 'manifest-expanded-compiled.json'
+    key = sut.get_compiled_key_for('manifest', {'puppet_account_id': 9})
+
+    # exercise
+    sut.save_compiled(path, key, compiled)
+    actual_result = sut.load_compiled(path, key)
+
+    # verify
+    assert actual_result.get('task_defs') == compiled.get('task_defs')
+    assert actual_result.get('parameter_tables') == compiled.get('parameter_tables')
+    assert sut.load_compiled(path, sut.get_compiled_key_for('manifest', {'puppet_account_id': 10})) is None
+
+
+def test_iter_task_defs_for_launches_streams_the_compiled_task_defs(sut, shared_datadir):
+    # setup
+    manifest = json.loads((shared_datadir / 'account-vending' / 'manifest.json').read_text())
+    compiled = sut.compile_launches(manifest, 9, True, True)
+    parameter_tables = {}
+
+    # exercise
+    actual_result = sut.iter_task_defs_for_launches(manifest, 9, True, True, parameter_tables=parameter_tables)
+
+    # verify
+    assert next(actual_result) == compiled.get('task_defs')[0]
+    assert len(parameter_tables) == 1
+    assert list(actual_result) == compiled.get('task_defs')[1:]
+    assert parameter_tables == compiled.get('parameter_tables')
+
+
+def test_load_merges_includes(sut, tmp_path):
+    # setup
+    (tmp_path / 'team-a.yaml').write_text(yaml.safe_dump({
+        'accounts': [{'account_id': '2', 'tags': ['team:a']}],
+        'launches': {'a': {'portfolio': 'p', 'product': 'a', 'version': 'v1'}},
+    }))
+    (tmp_path / 'manifest.yaml').write_text(yaml.safe_dump({
+        'schema': 'puppet-2019-04-01',
+        'includes': ['team-a.yaml'],
+        'accounts': [{'account_id': '1', 'tags': ['hub']}],
+        'launches': {'hub': {'portfolio': 'p', 'product': 'hub', 'version': 'v1'}},
+    }))
+
+    # exercise
+    with open(tmp_path / 'manifest.yaml', 'r') as f:
+        actual_result = sut.load(f)
+
+    # verify
+    assert 'includes' not in actual_result
+    assert [account.get('account_id') for account in actual_result.get('accounts')] == ['1', '2']
+    assert list(actual_result.get('launches').keys()) == ['hub', 'a']
+    assert actual_result.get('fragments') == {'team-a.yaml': {'launches': ['a']}}
+
+
+def test_load_uses_the_json_sidecar_until_the_manifest_changes(sut, tmp_path):
+    # setup
+    path = tmp_path / 'manifest-expanded.yaml'
+    content = sut.dump_yaml({'schema': 'puppet-2019-04-01', 'launches': {}})
+    path.write_text(content)
+    sut.save_sidecar(str(path), content, {'schema': 'puppet-2019-04-01', 'launches': {'from-sidecar': {}}})
+
+    # exercise
+    with open(path, 'r') as f:
+        actual_result = sut.load(f)
+    path.write_text(sut.dump_yaml({'schema': 'puppet-2019-04-01', 'launches': {'changed': {}}}))
+    with open(path, 'r') as f:
+        actual_result_when_stale = sut.load(f)
+
+    # verify
+    assert list(actual_result.get('launches').keys()) == ['from-sidecar']
+    assert list(actual_result_when_stale.get('launches').keys()) == ['changed']
+
+
+def test_compile_launches_by_fragment_reuses_unchanged_fragments(sut, mocker):
+    # setup
+    def launch(product, depends_on=[]):
+        return {
+            'portfolio': 'p', 'product': product, 'version': 'v1', 'depends_on': depends_on,
+            'deploy_to': {'tags': [{'tag': 'type:prod', 'regions': ['eu-west-1']}]},
+        }
+    manifest = {
+        'accounts': [{'account_id': '1', 'tags': ['type:prod']}],
+        'launches': {'hub': launch('hub'), 'a': launch('a', ['hub']), 'b': launch('b')},
+        'fragments': {'team-a.yaml': {'launches': ['a']}, 'team-b.yaml': {'launches': ['b']}},
+    }
+    cache = {}
+    sut.compile_launches_by_fragment(manifest, 9, True, True, cache=cache)
+    manifest['launches']['b']['version'] = 'v2'
+    spy = mocker.spy(sut, 'iter_task_defs_for_launches')
+
+    # exercise
+    actual_result = sut.compile_launches_by_fragment(manifest, 9, True, True, cache=cache)
+
+    # verify
+    assert spy.call_count == 1
+    assert spy.call_args[0][7] == ['b']
+    assert actual_result == sut.compile_launches(manifest, 9, True, True)
+    assert len(cache) == 3
+
+
+def test_select_changed_launches_includes_dependants(sut):
+    # setup
+    previous_manifest = {
+        'accounts': [{'account_id': '1', 'tags': ['type:prod']}],
+        'launches': {
+            launch_name: {
+                'portfolio': 'portfolio-a', 'product': launch_name, 'version': 'v1',
+                'depends_on': depends_on,
+                'deploy_to': {'tags': [{'tag': 'type:prod', 'regions': ['eu-west-1']}]},
+            } for launch_name, depends_on in [('a', []), ('b', ['a']), ('c', ['b']), ('d', [])]
+        },
+    }
+    manifest = json.loads(json.dumps(previous_manifest))
+    manifest['launches']['b']['version'] = 'v2'
+    manifest['launches']['d']['parameters'] = {'e': {'default': 'f'}}
+    previous_compiled = sut.compile_launches(previous_manifest, 9, True, True)
+    compiled = sut.compile_launches(manifest, 9, True, True)
+
+    # exercise
+    changed_keys, removed_keys = sut.get_changed_launch_keys(previous_compiled, compiled)
+    actual_result = sut.select_changed_launches(compiled.get('task_defs'), changed_keys)
+
+    # verify
+    assert changed_keys == [('b', '1', 'eu-west-1'), ('d', '1', 'eu-west-1')]
+    assert removed_keys == []
+    assert {sut.get_key_for(task_def): task_def.get('dependencies') for task_def in actual_result} == {
+        ('b', '1', 'eu-west-1'): (),
+        ('c', '1', 'eu-west-1'): (('b', '1', 'eu-west-1'),),
+        ('d', '1', 'eu-west-1'): (),
+    }
+
+
+def test_build_manifest_index(sut):
+    # setup
+    account_a = {'account_id': '1', 'tags': ['type:prod', 'partition:eu']}
+    account_b = {'account_id': '2', 'tags': ['type:prod']}
+    account_c = {'account_id': '3'}
+    manifest = {
+        'accounts': [account_a, account_b, account_c]
+    }
+
+    # exercise
+    actual_result = sut.build_manifest_index(manifest)
+
+    # verify
+    assert actual_result.get('accounts_by_id') == {'1': account_a, '2': account_b, '3': account_c}
+    assert actual_result.get('accounts_by_tag') == {
+        'type:prod': [account_a, account_b],
+        'partition:eu': [account_a],
+    }
+
+
+def test_build_launch_dependency_graph(sut):
+    # setup
+    task_defs = [
+        {
+            'launch_name': 'child', 'account_id': '1', 'region': 'eu-west-1',
+            'depends_on': [{'name': 'parent', 'scope': 'global'}],
+        },
+        {'launch_name': 'parent', 'account_id': '1', 'region': 'eu-west-1', 'depends_on': []},
+        {'launch_name': 'parent', 'account_id': '2', 'region': 'eu-west-1', 'depends_on': []},
+    ]
+
+    # exercise
+    actual_result = sut.build_launch_dependency_graph(task_defs)
+
+    # verify
+    assert actual_result.get('edges') == {
+        ('child', '1', 'eu-west-1'): [('parent', '1', 'eu-west-1'), ('parent', '2', 'eu-west-1')],
+        ('parent', '1', 'eu-west-1'): [],
+        ('parent', '2', 'eu-west-1'): [],
+    }
+    assert actual_result.get('order') == [
+        ('parent', '1', 'eu-west-1'),
+        ('parent', '2', 'eu-west-1'),
+        ('child', '1', 'eu-west-1'),
+    ]
+
+
+def test_build_launch_dependency_graph_scopes_depends_on(sut):
+    # setup
+    task_defs = [
+        {'launch_name': 'child', 'account_id': '1', 'region': 'eu-west-1', 'depends_on': ['parent']},
+        {
+            'launch_name': 'sibling', 'account_id': '1', 'region': 'eu-west-1',
+            'depends_on': [{'name': 'parent', 'scope': 'same-account'}],
+        },
+        {'launch_name': 'parent', 'account_id': '1', 'region': 'eu-west-1', 'depends_on': []},
+        {'launch_name': 'parent', 'account_id': '1', 'region': 'eu-west-2', 'depends_on': []},
+        {'launch_name': 'parent', 'account_id': '2', 'region': 'eu-west-1', 'depends_on': []},
+    ]
+
+    # exercise
+    actual_result = sut.build_launch_dependency_graph(task_defs)
+
+    # verify
+    assert actual_result.get('edges').get(('child', '1', 'eu-west-1')) == [('parent', '1', 'eu-west-1')]
+    assert actual_result.get('edges').get(('sibling', '1', 'eu-west-1')) == [
+        ('parent', '1', 'eu-west-1'), ('parent', '1', 'eu-west-2'),
+    ]
+
+
+def test_build_launch_dependency_graph_detects_cycles(sut):
+    # setup
+    task_defs = [
+        {'launch_name': 'a', 'account_id': '1', 'region': 'eu-west-1', 'depends_on': ['b']},
+        {'launch_name': 'b', 'account_id': '1', 'region': 'eu-west-1', 'depends_on': ['a']},
+        {'launch_name': 'c', 'account_id': '1', 'region': 'eu-west-1', 'depends_on': []},
+    ]
+
+    # exercise
+    with pytest.raises(Exception) as e:
+        sut.build_launch_dependency_graph(task_defs)
+
+    # verify
+    assert str(e.exconly()) == "Exception: Launches have a cyclic dependency: a, b"
@@ -0,0 +1,184 @@
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__file__)
+
+
+def build_account_index(client):
+    logger.info('Listing all accounts in the organization')
+    accounts = client.list_accounts_single_page().get('Accounts', [])
+    logger.info(f"Found {len(accounts)} accounts in the organization")
+    return {account.get('Id'): account for account in accounts}
+
+
+def list_children_for(client, parent_id):
+    accounts = client.list_children_single_page(ParentId=parent_id, ChildType='ACCOUNT').get('Children', [])
+    organizational_units = client.list_organizational_units_for_parent_single_page(
+        ParentId=parent_id
+    ).get('OrganizationalUnits', [])
+    return [account.get('Id') for account in accounts], organizational_units
+
+
+def build_ou_tree(client, max_workers=5):
+    logger.info('Building the ou tree')
+    roots = client.list_roots().get('Roots', [])
+    ous = {}
+    paths = {}
+    for root in roots:
+        ous[root.get('Id')] = {
+            'id': root.get('Id'),
+            'name': root.get('Name'),
+            'path': '/',
+            'parent_id': None,
+            'accounts': [],
+            'children': [],
+        }
+    if len(roots) == 1:
+        paths['/'] = roots[0].get('Id')
+
+    level = list(ous.keys())
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while len(level) > 0:
+            next_level = []
+            for ou_id, (accounts, organizational_units) in zip(
+                    level, executor.map(lambda parent_id: list_children_for(client, parent_id), level)
+            ):
+                ou = ous[ou_id]
+                ou['accounts'] = accounts
+                for organizational_unit in organizational_units:
+                    child_id = organizational_unit.get('Id')
+                    child_path = f"{ou.get('path').rstrip('/')}/{organizational_unit.get('Name')}"
+                    ous[child_id] = {
+                        'id': child_id,
+                        'name': organizational_unit.get('Name'),
+                        'path': child_path,
+                        'parent_id': ou_id,
+                        'accounts': [],
+                        'children': [],
+                    }
+                    paths[child_path] = child_id
+                    ou['children'].append(child_id)
+                    next_level.append(child_id)
+            level = next_level
+
+    logger.info(f"Finished building the ou tree, found {len(ous)} ous")
+    return {
+        'ous': ous,
+        'paths': paths,
+    }
+
+
+def get_ou_for_path(ou_tree, path):
+    ou_id = ou_tree.get('paths').get(path)
+    if ou_id is None:
+        raise Exception(f"Could not find an ou for the path: {path}")
+    return ou_id
+
+
+def get_ou_for(ou_tree, ou_or_path):
+    if ou_or_path.startswith('/'):
+        return get_ou_for_path(ou_tree, ou_or_path)
+    if ou_or_path not in ou_tree.get('ous'):
+        raise Exception(f"Could not find the ou: {ou_or_path}")
+    return ou_or_path
+
+
+def get_accounts_for_ou(ou_tree, ou_id):
+    accounts = []
+    ous_to_visit = [ou_id]
+    while len(ous_to_visit) > 0:
+        ou = ou_tree.get('ous').get(ous_to_visit.pop())
+        accounts += ou.get('accounts')
+        ous_to_visit += reversed(ou.get('children'))
+    return accounts
+
+
+def get_accounts_for_ou_excluding(ou_tree, ou_id, excluded_ous):
+    excluded_accounts = set()
+    for excluded_ou in excluded_ous:
+        excluded_accounts.update(get_accounts_for_ou(ou_tree, get_ou_for(ou_tree, excluded_ou)))
+    return [
+        account_id for account_id in get_accounts_for_ou(ou_tree, get_ou_for(ou_tree, ou_id))
+        if account_id not in excluded_accounts
+    ]
+
+
+def build_snapshot(client, now=None):
+    return {
+        'timestamp': time.time() if now is None else now,
+        'accounts': build_account_index(client),
+        'ou_tree': build_ou_tree(client),
+    }
+
+
+def refresh_snapshot(client, snapshot, ttl, now=None):
+    if now is None:
+        now = time.time()
+    if snapshot is None:
+        logger.info('There is no org snapshot, crawling the organization')
+        return build_snapshot(client, now)
+    if now - snapshot.get('timestamp') > ttl:
+        logger.info('The org snapshot is older than its ttl, crawling the organization')
+        return build_snapshot(client, now)
+
+    accounts = build_account_index(client)
+    previous_accounts = snapshot.get('accounts')
+    ou_tree = snapshot.get('ou_tree')
+    ous = ou_tree.get('ous')
+
+    parent_by_account_id = {}
+    for ou_id, ou in ous.items():
+        for account_id in ou.get('accounts'):
+            parent_by_account_id[account_id] = ou_id
+
+    ous_to_refresh = set()
+    for account_id in previous_accounts.keys():
+        if account_id not in accounts and parent_by_account_id.get(account_id) is not None:
+            logger.info(f"{account_id} has left the organization")
+            ous_to_refresh.add(parent_by_account_id.get(account_id))
+
+    for account_id in accounts.keys():
+        if account_id not in previous_accounts:
+            logger.info(f"{account_id} has joined the organization")
+            parents = client.list_parents(ChildId=account_id).get('Parents', [])
+            parent_id = parents[0].get('Id') if len(parents) > 0 else None
+            if parent_id not in ous:
+                logger.info(f"{account_id} is in an ou that is not in the org snapshot, crawling the organization")
+                return build_snapshot(client, now)
+            ous_to_refresh.add(parent_id)
+
+    for ou_id in ous_to_refresh:
+        logger.info(f"Refreshing the accounts in {ou_id}")
+        ous[ou_id]['accounts'] = [
+            child.get('Id') for child in
+            client.list_children_single_page(ParentId=ou_id, ChildType='ACCOUNT').get('Children', [])
+        ]
+
+    return {
+        'timestamp': snapshot.get('timestamp'),
+        'accounts': accounts,
+        'ou_tree': ou_tree,
+    }
+
+
+def load_snapshot(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r') as f:
+        return json.loads(f.read())
+
+
+def save_snapshot(snapshot, path):
+    with open(path, 'w') as f:
+        f.write(json.dumps(snapshot, default=str))
+
+
+def get_snapshot(client, path=None, ttl=0):
+    if path is None:
+        return build_snapshot(client)
+    snapshot = refresh_snapshot(client, load_snapshot(path), ttl)
+    save_snapshot(snapshot, path)
+    return snapshot
@@ -0,0 +1,127 @@
+# Copyright 2019 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+import pytest
+from pytest import fixture
+
+
+@fixture
+def sut():
+    from servicecatalog_puppet import organizations
+    return organizations
+
+
+@fixture
+def client(mocker):
+    organizational_units = {
+        'r-root': [{'Id': 'ou-a', 'Name': 'a'}, {'Id': 'ou-b', 'Name': 'b'}],
+        'ou-a': [{'Id': 'ou-a-c', 'Name': 'c'}],
+        'ou-b': [],
+        'ou-a-c': [],
+    }
+    accounts = {
+        'r-root': ['0'],
+        'ou-a': ['1'],
+        'ou-b': ['2', '3'],
+        'ou-a-c': ['4'],
+    }
+    client = mocker.Mock()
+    client.list_roots.return_value = {'Roots': [{'Id': 'r-root', 'Name': 'Root'}]}
+    client.list_organizational_units_for_parent_single_page.side_effect = lambda ParentId: {
+        'OrganizationalUnits': organizational_units[ParentId]
+    }
+    client.list_children_single_page.side_effect = lambda ParentId, ChildType: {
+        'Children': [{'Id': account_id} for account_id in accounts[ParentId]]
+    }
+    return client
+
+
+def test_build_ou_tree(sut, client):
+    # exercise
+    actual_result = sut.build_ou_tree(client)
+
+    # verify
+    assert actual_result.get('paths') == {
+        '/': 'r-root',
+        '/a': 'ou-a',
+        '/b': 'ou-b',
+        '/a/c': 'ou-a-c',
+    }
+    assert actual_result.get('ous').get('ou-a').get('children') == ['ou-a-c']
+    assert client.list_children_single_page.call_count == 4
+
+
+def test_get_accounts_for_ou(sut, client):
+    # setup
+    ou_tree = sut.build_ou_tree(client)
+
+    # exercise
+    actual_result = sut.get_accounts_for_ou(ou_tree, sut.get_ou_for_path(ou_tree, '/'))
+
+    # verify
+    assert actual_result == ['0', '1', '4', '2', '3']
+
+
+def test_get_accounts_for_ou_excluding(sut, client):
+    # setup
+    ou_tree = sut.build_ou_tree(client)
+
+    # exercise
+    actual_result = sut.get_accounts_for_ou_excluding(ou_tree, 'r-root', ['/a/c', 'ou-b'])
+
+    # verify
+    assert actual_result == ['0', '1']
+
+
+def test_get_ou_for_path_raises_for_unknown_path(sut, client):
+    # setup
+    ou_tree = sut.build_ou_tree(client)
+
+    # exercise
+    with pytest.raises(Exception) as e:
+        sut.get_ou_for_path(ou_tree, '/d')
+
+    # verify
+    assert str(e.exconly()) == "Exception: Could not find an ou for the path: /d"
+
+
+def test_refresh_snapshot_only_relists_changed_ous(sut, mocker, shared_datadir):
+    # setup
+    snapshot = sut.load_snapshot(shared_datadir / 'organizations' / 'snapshot.json')
+    client = mocker.Mock()
+    client.list_accounts_single_page.return_value = {
+        'Accounts': [
+            {'Id': '0', 'Status': 'ACTIVE'},
+            {'Id': '1', 'Status': 'ACTIVE'},
+            {'Id': '3', 'Status': 'ACTIVE'},
+        ]
+    }
+    client.list_parents.return_value = {'Parents': [{'Id': 'ou-a', 'Type': 'ORGANIZATIONAL_UNIT'}]}
+    client.list_children_single_page.side_effect = lambda ParentId, ChildType: {
+        'Children': [{'Id': account_id} for account_id in {'ou-a': ['1', '3'], 'ou-b': []}[ParentId]]
+    }
+
+    # exercise
+    actual_result = sut.refresh_snapshot(client, snapshot, ttl=100, now=1050)
+
+    # verify
+    assert actual_result.get('timestamp') == 1000
+    assert sorted(actual_result.get('accounts').keys()) == ['0', '1', '3']
+    assert sut.get_accounts_for_ou(actual_result.get('ou_tree'), 'r-root') == ['0', '1', '3']
+    client.list_roots.assert_not_called()
+    client.list_parents.assert_called_once_with(ChildId='3')
+    assert sorted(call.kwargs.get('ParentId') for call in client.list_children_single_page.call_args_list) == [
+        'ou-a', 'ou-b',
+    ]
+
+
+def test_refresh_snapshot_crawls_when_the_ttl_has_expired(sut, client, shared_datadir):
+    # setup
+    snapshot = sut.load_snapshot(shared_datadir / 'organizations' / 'snapshot.json')
+    client.list_accounts_single_page.return_value = {'Accounts': []}
+
+    # exercise
+    actual_result = sut.refresh_snapshot(client, snapshot, ttl=100, now=2000)
+
+    # verify
+    assert actual_result.get('timestamp') == 2000
+    assert actual_result.get('ou_tree').get('paths').get('/a/c') == 'ou-a-c'
@@ -0,0 +1,91 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from boto3.session import Session
+from betterboto import client as betterboto_client
+
+logger = logging.getLogger(__file__)
+
+REFRESH_BEFORE_EXPIRY = timedelta(minutes=10)
+
+credentials_pool = {}
+credentials_pool_lock = threading.Lock()
+role_locks = {}
+
+
+def get_puppet_role_arn_for(account_id):
+    return f"arn:aws:iam::{account_id}:role/servicecatalog-puppet/PuppetRole"
+
+
+def get_role_lock_for(role_arn):
+    with credentials_pool_lock:
+        return role_locks.setdefault(role_arn, threading.Lock())
+
+
+def is_fresh(credentials, now=None):
+    if credentials is None:
+        return False
+    if now is None:
+        now = datetime.now(timezone.utc)
+    return credentials.get('Expiration') - now > REFRESH_BEFORE_EXPIRY
+
+
+def get_credentials_for(role_arn, role_session_name):
+    credentials = credentials_pool.get(role_arn)
+    if is_fresh(credentials):
+        return credentials
+    with get_role_lock_for(role_arn):
+        credentials = credentials_pool.get(role_arn)
+        if is_fresh(credentials):
+            return credentials
+        logger.info(f"Assuming {role_arn}")
+        credentials = Session().client('sts').assume_role(
+            RoleArn=role_arn,
+            RoleSessionName=role_session_name,
+        ).get('Credentials')
+        credentials_pool[role_arn] = credentials
+        return credentials
+
+
+def warm(role_arns, role_session_name='puppet-warm', max_workers=10):
+    def warm_role(role_arn):
+        try:
+            get_credentials_for(role_arn, role_session_name)
+        except Exception as e:
+            logger.warning(f"Could not warm the session for {role_arn}: {e}")
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        list(executor.map(warm_role, role_arns))
+    logger.info(f"Warmed sessions for {len(role_arns)} roles")
+
+
+def warm_in_background(role_arns, role_session_name='puppet-warm', max_workers=10):
+    thread = threading.Thread(target=warm, args=(list(role_arns), role_session_name, max_workers))
+    thread.start()
+    return thread
+
+
+class CrossAccountClientContextManager(object):
+    def __init__(self, service_name, role_arn, role_session_name, **kwargs):
+        super().__init__()
+        self.service_name = service_name
+        self.role_arn = role_arn
+        self.role_session_name = role_session_name
+        self.kwargs = kwargs
+
+    def __enter__(self):
+        credentials = get_credentials_for(self.role_arn, self.role_session_name)
+        kwargs = {
+            "service_name": self.service_name,
+            "aws_access_key_id": credentials.get('AccessKeyId'),
+            "aws_secret_access_key": credentials.get('SecretAccessKey'),
+            "aws_session_token": credentials.get('SessionToken'),
+        }
+        kwargs.update(self.kwargs)
+        self.client = betterboto_client.make_better(self.service_name, Session().client(**kwargs))
+        return self.client
+
+    def __exit__(self, *args, **kwargs):
+        self.client = None
@@ -0,0 +1,62 @@
+# Copyright 2019 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+from datetime import datetime, timedelta, timezone
+
+from pytest import fixture
+
+
+@fixture
+def sut(mocker):
+    from servicecatalog_puppet import sessions
+    mocker.patch.object(sessions, 'credentials_pool', {})
+    return sessions
+
+
+def credentials_expiring_in(minutes):
+    return {
+        'AccessKeyId': 'a',
+        'SecretAccessKey': 's',
+        'SessionToken': 't',
+        'Expiration': datetime.now(timezone.utc) + timedelta(minutes=minutes),
+    }
+
+
+def test_get_credentials_for_reuses_credentials_until_shortly_before_expiry(sut, mocker):
+    # setup
+    mocked_session = mocker.patch.object(sut, 'Session')
+    assume_role = mocked_session.return_value.client.return_value.assume_role
+    assume_role.side_effect = [
+        {'Credentials': credentials_expiring_in(60)},
+        {'Credentials': credentials_expiring_in(60)},
+    ]
+    role_arn = sut.get_puppet_role_arn_for('0123456789010')
+
+    # exercise
+    first = sut.get_credentials_for(role_arn, 'a')
+    second = sut.get_credentials_for(role_arn, 'b')
+    sut.credentials_pool[role_arn] = credentials_expiring_in(5)
+    third = sut.get_credentials_for(role_arn, 'c')
+
+    # verify
+    assert first is second
+    assert assume_role.call_count == 2
+    assert third.get('Expiration') > datetime.now(timezone.utc) + timedelta(minutes=30)
+
+
+def test_warm_assumes_each_role_once_and_carries_on_after_failures(sut, mocker):
+    # setup
+    role_arns = [sut.get_puppet_role_arn_for(account_id) for account_id in ['1', '2', '3']]
+
+    def assume_role(RoleArn, RoleSessionName):
+        if RoleArn == role_arns[1]:
+            raise Exception('AccessDenied')
+        return {'Credentials': credentials_expiring_in(60)}
+
+    mocked_session = mocker.patch.object(sut, 'Session')
+    mocked_session.return_value.client.return_value.assume_role.side_effect = assume_role
+
+    # exercise
+    sut.warm(role_arns + role_arns)
+
+    # verify
+    assert sorted(sut.credentials_pool.keys()) == [role_arns[0], role_arns[2]]
@@ -0,0 +1,90 @@
+import functools
+import logging
+import re
+
+logger = logging.getLogger(__file__)
+
+TOKEN_PATTERN = re.compile(r"\(|\)|[^\s()]+")
+OPERATORS = ['and', 'or', 'not']
+
+
+def tokenize(expression):
+    return TOKEN_PATTERN.findall(expression)
+
+
+@functools.lru_cache(maxsize=None)
+def parse(expression):
+    tokens = tokenize(expression)
+    node, position = parse_or(expression, tokens, 0)
+    if position != len(tokens):
+        raise Exception(f"Unexpected {tokens[position]} in the tag expression: {expression}")
+    return node
+
+
+def parse_or(expression, tokens, position):
+    node, position = parse_and(expression, tokens, position)
+    while position < len(tokens) and tokens[position] == 'or':
+        right, position = parse_and(expression, tokens, position + 1)
+        node = ('or', node, right)
+    return node, position
+
+
+def parse_and(expression, tokens, position):
+    node, position = parse_not(expression, tokens, position)
+    while position < len(tokens) and tokens[position] == 'and':
+        right, position = parse_not(expression, tokens, position + 1)
+        node = ('and', node, right)
+    return node, position
+
+
+def parse_not(expression, tokens, position):
+    if position >= len(tokens):
+        raise Exception(f"Unexpected end of the tag expression: {expression}")
+    token = tokens[position]
+    if token == 'not':
+        node, position = parse_not(expression, tokens, position + 1)
+        return ('not', node), position
+    if token == '(':
+        node, position = parse_or(expression, tokens, position + 1)
+        if position >= len(tokens) or tokens[position] != ')':
+            raise Exception(f"Missing ) in the tag expression: {expression}")
+        return node, position + 1
+    if token == ')' or token in OPERATORS:
+        raise Exception(f"Unexpected {token} in the tag expression: {expression}")
+    return ('tag', token), position + 1
+
+
+def build_bitsets(accounts):
+    tags = {}
+    for i, account in enumerate(accounts):
+        for tag in account.get('tags', []):
+            tags[tag] = tags.get(tag, 0) | (1 << i)
+    return {
+        'all': (1 << len(accounts)) - 1,
+        'tags': tags,
+    }
+
+
+def evaluate(node, bitsets):
+    operator = node[0]
+    if operator == 'tag':
+        return bitsets.get('tags').get(node[1], 0)
+    if operator == 'not':
+        return bitsets.get('all') & ~evaluate(node[1], bitsets)
+    if operator == 'and':
+        return evaluate(node[1], bitsets) & evaluate(node[2], bitsets)
+    if operator == 'or':
+        return evaluate(node[1], bitsets) | evaluate(node[2], bitsets)
+    raise Exception(f"Unsupported tag expression operator: {operator}")
+
+
+def get_indexes_for(bitset):
+    while bitset:
+        lowest_bit = bitset & -bitset
+        yield lowest_bit.bit_length() - 1
+        bitset ^= lowest_bit
+
+
+def get_accounts_for(expression, accounts, bitsets):
+    for i in get_indexes_for(evaluate(parse(expression), bitsets)):
+        yield accounts[i]
@@ -0,0 +1,68 @@
+# Copyright 2019 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+import pytest
+from pytest import fixture
+
+
+@fixture
+def sut():
+    from servicecatalog_puppet import tag_expressions
+    return tag_expressions
+
+
+accounts = [
+    {'account_id': '1', 'tags': ['type:prod', 'partition:eu']},
+    {'account_id': '2', 'tags': ['type:prod', 'partition:eu', 'scope:pci']},
+    {'account_id': '3', 'tags': ['type:prod', 'partition:us']},
+    {'account_id': '4', 'tags': ['type:dev', 'partition:eu']},
+]
+
+
+def test_parse_gives_not_and_or_their_precedence(sut):
+    # exercise
+    actual_result = sut.parse('a or not b and (c or d)')
+
+    # verify
+    assert actual_result == (
+        'or',
+        ('tag', 'a'),
+        ('and', ('not', ('tag', 'b')), ('or', ('tag', 'c'), ('tag', 'd'))),
+    )
+
+
+@pytest.mark.parametrize(
+    "expression,expected_result",
+    [
+        ('type:prod', ['1', '2', '3']),
+        ('type:prod and partition:eu and not scope:pci', ['1']),
+        ('partition:us or type:dev', ['3', '4']),
+        ('not (type:prod or partition:eu)', []),
+        ('type:unknown or scope:pci', ['2']),
+    ]
+)
+def test_get_accounts_for(sut, expression, expected_result):
+    # setup
+    bitsets = sut.build_bitsets(accounts)
+
+    # exercise
+    actual_result = sut.get_accounts_for(expression, accounts, bitsets)
+
+    # verify
+    assert [account.get('account_id') for account in actual_result] == expected_result
+
+
+@pytest.mark.parametrize(
+    "expression,expected_message",
+    [
+        ('type:prod and', "Exception: Unexpected end of the tag expression: type:prod and"),
+        ('(type:prod', "Exception: Missing ) in the tag expression: (type:prod"),
+        ('type:prod type:dev', "Exception: Unexpected type:dev in the tag expression: type:prod type:dev"),
+    ]
+)
+def test_parse_rejects_invalid_expressions(sut, expression, expected_message):
+    # exercise
+    with pytest.raises(Exception) as e:
+        sut.parse(expression)
+
+    # verify
+    assert str(e.exconly()) == expected_message
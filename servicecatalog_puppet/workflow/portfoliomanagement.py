@@ -9,6 +9,7 @@ from betterboto import client as betterboto_client
 
 from servicecatalog_puppet import aws
 from servicecatalog_puppet import config
+from servicecatalog_puppet import sessions
 
 from servicecatalog_puppet.workflow import provisioning
 from servicecatalog_puppet.workflow import tasks
@@ -54,7 +55,7 @@ class GetVersionIdByVersionName(tasks.PuppetTask):
     def run(self):
         with self.input().get('product').open('r') as f:
             product_details = json.loads(f.read())
-        with betterboto_client.CrossAccountClientContextManager(
+        with sessions.CrossAccountClientContextManager(
                 'servicecatalog',
                 f"arn:aws:iam::{self.account_id}:role/servicecatalog-puppet/PuppetRole",
                 f"{self.account_id}-{self.region}",
@@ -113,7 +114,7 @@ class GetProductIdByProductName(tasks.PuppetTask):
     def run(self):
         with self.input().get('portfolio').open('r') as f:
             portfolio_details = json.loads(f.read())
-        with betterboto_client.CrossAccountClientContextManager(
+        with sessions.CrossAccountClientContextManager(
                 'servicecatalog',
                 f"arn:aws:iam::{self.account_id}:role/servicecatalog-puppet/PuppetRole",
                 f"{self.account_id}-{self.region}",
@@ -158,7 +159,7 @@ class GetPortfolioIdByPortfolioName(tasks.PuppetTask):
         )
 
     def run(self):
-        with betterboto_client.CrossAccountClientContextManager(
+        with sessions.CrossAccountClientContextManager(
                 'servicecatalog',
                 f"arn:aws:iam::{self.account_id}:role/servicecatalog-puppet/PuppetRole",
                 f"{self.account_id}-{self.region}",
@@ -234,7 +235,7 @@ class ProvisionActionTask(tasks.PuppetTask):
         ]
 
         role = f"arn:aws:iam::{self.account_id}:role/servicecatalog-puppet/PuppetRole"
-        with betterboto_client.CrossAccountClientContextManager(
+        with sessions.CrossAccountClientContextManager(
                 'codebuild', role, f'sc-{self.region}-{self.account_id}', region_name=self.region
         ) as codebuild:
             build = codebuild.start_build_and_wait_for_completion(
@@ -288,7 +289,7 @@ class CreateSpokeLocalPortfolioTask(tasks.PuppetTask):
     def run(self):
         logger.info(f"[{self.portfolio}] {self.account_id}:{self.region} :: starting creating portfolio")
         role = f"arn:aws:iam::{self.account_id}:role/servicecatalog-puppet/PuppetRole"
-        with betterboto_client.CrossAccountClientContextManager(
+        with sessions.CrossAccountClientContextManager(
                 'servicecatalog', role, f'sc-{self.account_id}-{self.region}', region_name=self.region
         ) as spoke_service_catalog:
             spoke_portfolio = aws.ensure_portfolio(
@@ -330,7 +331,7 @@ class CreateAssociationsForPortfolioTask(tasks.PuppetTask):
                 organization=self.organization,
                 pre_actions=self.pre_actions,
             ),
-            'deps': [provisioning.ProvisionProductTask(**dependency) for dependency in self.dependencies]
+            'deps': [tasks.get_registered_task(dependency) for dependency in self.dependencies]
         }
 
     @property
@@ -343,7 +344,7 @@ class CreateAssociationsForPortfolioTask(tasks.PuppetTask):
 
     def get_graph_lines(self):
         return [
-            f"\"{CreateAssociationsForPortfolioTask.__name__}_{self.node_id}\" -> \"{provisioning.ProvisionProductTask.__name__}_{'_'.join([dep.get('launch_name'), dep.get('portfolio'), dep.get('product'), dep.get('version'), dep.get('account_id'), dep.get('region')])}\""
+            f"\"{CreateAssociationsForPortfolioTask.__name__}_{self.node_id}\" -> \"{provisioning.ProvisionProductTask.__name__}_{tasks.get_registered_task(dep).node_id}\""
             for dep in self.dependencies
         ] + [
             f"\"{CreateAssociationsForPortfolioTask.__name__}_{self.node_id}\" -> \"{CreateSpokeLocalPortfolioTask.__name__}_{'_'.join([self.portfolio, self.account_id, self.region])}\""
@@ -370,7 +371,7 @@ class CreateAssociationsForPortfolioTask(tasks.PuppetTask):
             portfolio_id = json.loads(f.read()).get('Id')
         logger.info(f"[{self.portfolio}] {self.account_id}:{self.region} :: using portfolio_id: {portfolio_id}")
 
-        with betterboto_client.CrossAccountClientContextManager(
+        with sessions.CrossAccountClientContextManager(
                 'cloudformation', role, f'cfn-{self.account_id}-{self.region}', region_name=self.region
         ) as cloudformation:
             template = config.env.get_template('associations.template.yaml.j2').render(
@@ -492,7 +493,7 @@ class ImportIntoSpokeLocalPortfolioTask(tasks.PuppetTask):
                 logger.info(f"[{self.portfolio}] {self.account_id}:{self.region} {hub_product_name} :: searching in "
                             f"spoke for product")
                 role = f"arn:aws:iam::{self.account_id}:role/servicecatalog-puppet/PuppetRole"
-                with betterboto_client.CrossAccountClientContextManager(
+                with sessions.CrossAccountClientContextManager(
                         'servicecatalog', role, f"sc-{self.account_id}-{self.region}", region_name=self.region
                 ) as spoke_service_catalog:
                     p = None
@@ -646,7 +647,7 @@ class CreateLaunchRoleConstraintsForPortfolio(tasks.PuppetTask):
                 pre_actions=self.pre_actions,
                 post_actions=self.post_actions,
             ),
-            'deps': [provisioning.ProvisionProductTask(**dependency) for dependency in self.dependencies]
+            'deps': [tasks.get_registered_task(dependency) for dependency in self.dependencies]
         }
 
     @property
@@ -659,7 +660,7 @@ class CreateLaunchRoleConstraintsForPortfolio(tasks.PuppetTask):
 
     def get_graph_lines(self):
         return [
-            f"\"{CreateLaunchRoleConstraintsForPortfolio.__name__}_{self.node_id}\" -> \"{provisioning.ProvisionProductTask.__name__}_{'_'.join([dep.get('launch_name'), dep.get('portfolio'), dep.get('product'), dep.get('version'), dep.get('account_id'), dep.get('region')])}\""
+            f"\"{CreateLaunchRoleConstraintsForPortfolio.__name__}_{self.node_id}\" -> \"{provisioning.ProvisionProductTask.__name__}_{tasks.get_registered_task(dep).node_id}\""
             for dep in self.dependencies
         ] + [
             f"\"{CreateLaunchRoleConstraintsForPortfolio.__name__}_{self.node_id}\" -> \"{ImportIntoSpokeLocalPortfolioTask.__name__}_{self.node_id}\""
@@ -674,7 +675,7 @@ class CreateLaunchRoleConstraintsForPortfolio(tasks.PuppetTask):
         spoke_portfolio = dependency_output.get('portfolio')
         portfolio_id = spoke_portfolio.get('Id')
         product_name_to_id_dict = dependency_output.get('products')
-        with betterboto_client.CrossAccountClientContextManager(
+        with sessions.CrossAccountClientContextManager(
                 'cloudformation', role, f'cfn-{self.account_id}-{self.region}', region_name=self.region
         ) as cloudformation:
             new_launch_constraints = []
@@ -687,7 +688,7 @@ class CreateLaunchRoleConstraintsForPortfolio(tasks.PuppetTask):
                     if isinstance(launch_constraint.get('products'), tuple):
                         new_launch_constraint['products'] += launch_constraint.get('products')
                     elif isinstance(launch_constraint.get('products'), str):
-                        with betterboto_client.CrossAccountClientContextManager(
+                        with sessions.CrossAccountClientContextManager(
                                 'servicecatalog', role, f'sc-{self.account_id}-{self.region}', region_name=self.region
                         ) as service_catalog:
                             response = service_catalog.search_products_as_admin_single_page(PortfolioId=portfolio_id)
@@ -835,7 +836,7 @@ class ShareAndAcceptPortfolioTask(tasks.PuppetTask):
             else:
                 logging.info(f"{self.uid}: sharing {portfolio_id} with {self.account_id}")
 
-            with betterboto_client.CrossAccountClientContextManager(
+            with sessions.CrossAccountClientContextManager(
                     'servicecatalog',
                     f"arn:aws:iam::{self.account_id}:role/servicecatalog-puppet/PuppetRole",
                     f"{self.account_id}-{self.region}-PuppetRole",
@@ -5,6 +5,7 @@ from betterboto import client as betterboto_client
 from servicecatalog_puppet import aws
 from servicecatalog_puppet import config
 from servicecatalog_puppet import constants
+from servicecatalog_puppet import sessions
 from servicecatalog_puppet.workflow import tasks
 from servicecatalog_puppet.workflow import portfoliomanagement
 
@@ -13,6 +14,23 @@ import logging
 logger = logging.getLogger("tasks")
 
 
+def get_node_id_for(launch_name, portfolio, product, version, account_id, region):
+    return "_".join([
+        launch_name,
+        portfolio,
+        product,
+        version,
+        account_id,
+        region,
+    ])
+
+
+def get_graph_node_for(task_name, launch_name, portfolio, product, version, account_id, region):
+    node_id = get_node_id_for(launch_name, portfolio, product, version, account_id, region)
+    label = f"<b>ProvisionProduct</b><br/>Launch: {launch_name}<br/>Portfolio: {portfolio}<br/>Product: {product}<br/>Version: {version}<br/>AccountId: {account_id}<br/>Region: {region}"
+    return f"\"{task_name}_{node_id}\" [fillcolor=lawngreen style=filled label= < {label} >]"
+
+
 class ProvisioningArtifactParametersTask(tasks.PuppetTask):
     portfolio = luigi.Parameter()
     product = luigi.Parameter()
@@ -55,7 +73,7 @@ class ProvisioningArtifactParametersTask(tasks.PuppetTask):
     def run(self):
         with self.input().get('details').open('r') as f:
             details = json.loads(f.read())
-            with betterboto_client.CrossAccountClientContextManager(
+            with sessions.CrossAccountClientContextManager(
                 'servicecatalog',
                 f"arn:aws:iam::{self.account_id}:role/servicecatalog-puppet/PuppetRole",
                 f"{self.account_id}-{self.region}-sc",
@@ -82,12 +100,9 @@ class ProvisionProductTask(tasks.PuppetTask):
     puppet_account_id = luigi.Parameter()
 
     parameters = luigi.ListParameter(default=[], significant=False)
+    parameters_id = luigi.OptionalParameter(default=None, significant=False)
     ssm_param_inputs = luigi.ListParameter(default=[], significant=False)
 
-    launch_parameters = luigi.DictParameter(default={}, significant=False)
-    manifest_parameters = luigi.DictParameter(default={}, significant=False)
-    account_parameters = luigi.DictParameter(default={}, significant=False)
-
     dependencies = luigi.ListParameter(default=[], significant=False)
 
     retry_count = luigi.IntParameter(default=1, significant=False)
@@ -113,16 +128,13 @@ class ProvisionProductTask(tasks.PuppetTask):
 
     def requires(self):
         all_params = {}
-        all_params.update(self.manifest_parameters)
-        all_params.update(self.launch_parameters)
-        all_params.update(self.account_parameters)
+        if self.parameters_id is not None:
+            all_params = tasks.get_registered_parameters(self.parameters_id)
 
         ssm_params = {}
 
         for param_name, param_details in all_params.items():
             if param_details.get('ssm'):
-                if param_details.get('default'):
-                    del param_details['default']
                 ssm_params[param_name] = tasks.GetSSMParamTask(
                     parameter_name=param_name,
                     name=param_details.get('ssm').get('name'),
@@ -144,19 +156,10 @@ class ProvisionProductTask(tasks.PuppetTask):
             self.account_id,
             self.region,
         )
-        for r in self.dependencies:
-            if r.get('status') is not None:
-                if r.get('status') == constants.TERMINATED:
-                    raise Exception("Unsupported")
-                new_r = r.get_wrapped()
-                del new_r['status']
-                dependencies.append(
-                    self.__class__(**new_r)
-                )
-            else:
-                dependencies.append(
-                    self.__class__(**r)
-                )
+        for dependency in self.dependencies:
+            dependencies.append(
+                tasks.get_registered_task(dependency)
+            )
 
         return {
             'dependencies': dependencies,
@@ -175,22 +178,19 @@ class ProvisionProductTask(tasks.PuppetTask):
 
     @property
     def node_id(self):
-        return "_".join([
-            self.launch_name,
-            self.portfolio,
-            self.product,
-            self.version,
-            self.account_id,
-            self.region,
-        ])
+        return get_node_id_for(
+            self.launch_name, self.portfolio, self.product, self.version, self.account_id, self.region
+        )
 
     def graph_node(self):
-        label = f"<b>ProvisionProduct</b><br/>Launch: {self.launch_name}<br/>Portfolio: {self.portfolio}<br/>Product: {self.product}<br/>Version: {self.version}<br/>AccountId: {self.account_id}<br/>Region: {self.region}"
-        return f"\"{self.__class__.__name__}_{self.node_id}\" [fillcolor=lawngreen style=filled label= < {label} >]"
+        return get_graph_node_for(
+            self.__class__.__name__,
+            self.launch_name, self.portfolio, self.product, self.version, self.account_id, self.region,
+        )
 
     def get_graph_lines(self):
         return [
-            f"\"{ProvisionProductTask.__name__}_{self.node_id}\" -> \"{ProvisionProductTask.__name__}_{'_'.join([dep.get('launch_name'), dep.get('portfolio'), dep.get('product'), dep.get('version'), dep.get('account_id'), dep.get('region')])}\""
+            f"\"{ProvisionProductTask.__name__}_{self.node_id}\" -> \"{ProvisionProductTask.__name__}_{tasks.get_registered_task(dep).node_id}\""
             for dep in self.dependencies
         ]
 
@@ -218,7 +218,7 @@ class ProvisionProductTask(tasks.PuppetTask):
         all_params = self.get_all_params()
 
         role = f"arn:aws:iam::{self.account_id}:role/servicecatalog-puppet/PuppetRole"
-        with betterboto_client.CrossAccountClientContextManager(
+        with sessions.CrossAccountClientContextManager(
                 'servicecatalog', role, f'sc-{self.region}-{self.account_id}', region_name=self.region
         ) as service_catalog:
             logger.info(f"[{self.uid}] looking for previous failures")
@@ -229,7 +229,7 @@ class ProvisionProductTask(tasks.PuppetTask):
             )
             logger.info(f"[{self.uid}] pp_id: {provisioned_product_id}, paid : {provisioning_artifact_id}")
 
-            with betterboto_client.CrossAccountClientContextManager(
+            with sessions.CrossAccountClientContextManager(
                     'cloudformation', role, f'cfn-{self.region}-{self.account_id}', region_name=self.region
             ) as cloudformation:
                 need_to_provision = True
@@ -270,7 +270,7 @@ class ProvisionProductTask(tasks.PuppetTask):
                     logger.info(f"[{self.uid}] about to provision with params: {json.dumps(params_to_use)}")
 
                     if provisioned_product_id:
-                        with betterboto_client.CrossAccountClientContextManager(
+                        with sessions.CrossAccountClientContextManager(
                                 'cloudformation', role, f'cfn-{self.region}-{self.account_id}', region_name=self.region
                         ) as cloudformation:
                             stack = aws.get_stack_output_for(
@@ -334,7 +334,7 @@ class ProvisionProductTask(tasks.PuppetTask):
                             self.should_use_sns,
                         )
 
-                with betterboto_client.CrossAccountClientContextManager(
+                with sessions.CrossAccountClientContextManager(
                         'cloudformation', role, f'cfn-{self.region}-{self.account_id}', region_name=self.region
                 ) as spoke_cloudformation:
                     stack_details = aws.get_stack_output_for(
@@ -402,7 +402,7 @@ class ProvisionProductDryRunTask(ProvisionProductTask):
         all_params = self.get_all_params()
 
         role = f"arn:aws:iam::{self.account_id}:role/servicecatalog-puppet/PuppetRole"
-        with betterboto_client.CrossAccountClientContextManager(
+        with sessions.CrossAccountClientContextManager(
                 'servicecatalog', role, f'sc-{self.region}-{self.account_id}', region_name=self.region
         ) as service_catalog:
             logger.info(f"[{self.uid}] looking for previous failures")
@@ -424,7 +424,7 @@ class ProvisionProductDryRunTask(ProvisionProductTask):
 
             logger.info(f"[{self.uid}] pp_id: {provisioned_product_id}, paid : {provisioning_artifact_id}")
 
-            with betterboto_client.CrossAccountClientContextManager(
+            with sessions.CrossAccountClientContextManager(
                     'cloudformation', role, f'cfn-{self.region}-{self.account_id}', region_name=self.region
             ) as cloudformation:
                 logging.info(
@@ -560,7 +560,7 @@ class TerminateProductTask(tasks.PuppetTask):
         with self.input().get('product').open('r') as f:
             product_id = json.loads(f.read()).get('product_id')
         role = f"arn:aws:iam::{self.account_id}:role/servicecatalog-puppet/PuppetRole"
-        with betterboto_client.CrossAccountClientContextManager(
+        with sessions.CrossAccountClientContextManager(
                 'servicecatalog', role, f'sc-{self.region}-{self.account_id}', region_name=self.region
         ) as service_catalog:
             logger.info(f"[{self.launch_name}] {self.account_id}:{self.region} :: looking for previous failures")
@@ -675,7 +675,7 @@ class TerminateProductDryRunTask(tasks.PuppetTask):
             product_id = json.loads(f.read()).get('product_id')
 
         role = f"arn:aws:iam::{self.account_id}:role/servicecatalog-puppet/PuppetRole"
-        with betterboto_client.CrossAccountClientContextManager(
+        with sessions.CrossAccountClientContextManager(
                 'servicecatalog', role, f'sc-{self.region}-{self.account_id}', region_name=self.region
         ) as service_catalog:
             logger.info(f"[{self.launch_name}] {self.account_id}:{self.region} :: looking for previous failures")
@@ -722,7 +722,7 @@ class ResetProvisionedProductOwnerTask(tasks.PuppetTask):
         )
 
         role = f"arn:aws:iam::{self.account_id}:role/servicecatalog-puppet/PuppetRole"
-        with betterboto_client.CrossAccountClientContextManager(
+        with sessions.CrossAccountClientContextManager(
                 'servicecatalog', role, f'sc-{self.region}-{self.account_id}', region_name=self.region
         ) as service_catalog:
             logger.info(
@@ -96,11 +96,20 @@ class TestProvisionProductTask():
         assert expected_result == actual_result
 
     def test_requires_generated_dependencies_happy_path(
-            self, module, minimal_params, dependencies
+            self, module, minimal_params, dependencies, mocker
     ):
         # setup
+        mocker.patch.object(module.tasks, 'task_registry', {})
         expected_dependencies = dependencies
-        sut = module.ProvisionProductTask(**minimal_params, dependencies=expected_dependencies)
+        for dependency in expected_dependencies:
+            module.tasks.register_task(
+                [dependency.get('launch_name'), dependency.get('account_id'), dependency.get('region')],
+                module.ProvisionProductTask(**dependency),
+            )
+        sut = module.ProvisionProductTask(**minimal_params, dependencies=[
+            [dependency.get('launch_name'), dependency.get('account_id'), dependency.get('region')]
+            for dependency in expected_dependencies
+        ])
 
         # exercise
         actual_result = sut.requires()
@@ -115,11 +124,12 @@ class TestProvisionProductTask():
     ):
         # setup
         mocker.patch.object(module, 'config')
+        mocker.patch.object(module.tasks, 'parameter_tables', {})
         expected_ssm_params = {
             'Foo': {
             }
         }
-        manifest_parameters = {
+        parameters = {
             'Foo': {
                 'ssm': {
                     'name': 'bar',
@@ -127,7 +137,8 @@ class TestProvisionProductTask():
                 }
             }
         }
-        sut = module.ProvisionProductTask(**minimal_params, manifest_parameters=manifest_parameters)
+        module.tasks.register_parameters('launch_name/account_id', parameters)
+        sut = module.ProvisionProductTask(**minimal_params, parameters_id='launch_name/account_id')
 
         # exercise
         actual_result = sut.requires()
@@ -14,6 +14,7 @@ from betterboto import client as betterboto_client
 from luigi import LuigiStatusCode
 
 from servicecatalog_puppet import config, constants
+from servicecatalog_puppet.workflow import workers
 
 import logging
 
@@ -21,7 +22,7 @@ logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
 
-def run_tasks(tasks_to_run, num_workers, dry_run=False):
+def run_tasks(tasks_to_run, num_workers, dry_run=False, execution_mode=constants.EXECUTION_MODE_PROCESSES):
     should_use_eventbridge = config.get_should_use_eventbridge(os.environ.get("AWS_DEFAULT_REGION")) and not dry_run
     should_forward_failures_to_opscenter = config.get_should_forward_failures_to_opscenter(os.environ.get("AWS_DEFAULT_REGION")) and not dry_run
 
@@ -35,10 +36,18 @@ def run_tasks(tasks_to_run, num_workers, dry_run=False):
     for type in ["failure", "success", "timeout", "process_failure", "processing_time", "broken_task", ]:
         os.makedirs(Path(constants.RESULTS_DIRECTORY) / type)
 
-    logger.info(f"About to run workflow with {num_workers} workers")
+    worker_scheduler_factory = None
+    if execution_mode == constants.EXECUTION_MODE_THREADS:
+        config.get_home_region()
+        worker_scheduler_factory = workers.ThreadedWorkerSchedulerFactory()
+    elif execution_mode != constants.EXECUTION_MODE_PROCESSES:
+        raise Exception(f"Unsupported execution mode: {execution_mode}")
+
+    logger.info(f"About to run workflow with {num_workers} workers using {execution_mode}")
 
     run_result = luigi.build(
         tasks_to_run,
+        worker_scheduler_factory=worker_scheduler_factory,
         local_scheduler=True,
         detailed_summary=True,
         workers=num_workers,
@@ -8,6 +8,34 @@ from betterboto import client as betterboto_client
 from servicecatalog_puppet import constants
 
 
+task_registry = {}
+
+
+def register_task(key, task):
+    task_registry[tuple(key)] = task
+
+
+def get_registered_task(key):
+    task = task_registry.get(tuple(key))
+    if task is None:
+        raise Exception(f"No task has been registered for: {key}")
+    return task
+
+
+parameter_tables = {}
+
+
+def register_parameters(parameters_id, parameters):
+    parameter_tables[parameters_id] = parameters
+
+
+def get_registered_parameters(parameters_id):
+    parameters = parameter_tables.get(parameters_id)
+    if parameters is None:
+        raise Exception(f"No parameters have been registered for: {parameters_id}")
+    return parameters
+
+
 class PuppetTask(luigi.Task):
 
     @property
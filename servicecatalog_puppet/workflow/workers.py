@@ -0,0 +1,55 @@
+import logging
+import threading
+
+from luigi import interface
+from luigi import worker
+
+logger = logging.getLogger("tasks")
+
+
+class ThreadedTaskProcess(object):
+    def __init__(self, task_process):
+        self.task_process = task_process
+        self.thread = threading.Thread(target=task_process.run, name=f"Task-{task_process.task.task_id}", daemon=True)
+
+    @property
+    def task(self):
+        return self.task_process.task
+
+    @property
+    def timeout_time(self):
+        return self.task_process.timeout_time
+
+    @property
+    def worker_timeout(self):
+        return self.task_process.worker_timeout
+
+    @property
+    def use_multiprocessing(self):
+        return True
+
+    @property
+    def exitcode(self):
+        return None
+
+    def start(self):
+        self.thread.start()
+
+    def run(self):
+        self.task_process.run()
+
+    def is_alive(self):
+        return self.thread.is_alive()
+
+    def terminate(self):
+        logger.warning(f"Cannot terminate the thread running {self.task.task_id}, it will finish in the background")
+
+
+class ThreadedWorker(worker.Worker):
+    def _create_task_process(self, task):
+        return ThreadedTaskProcess(super()._create_task_process(task))
+
+
+class ThreadedWorkerSchedulerFactory(interface._WorkerSchedulerFactory):
+    def create_worker(self, scheduler, worker_processes, assistant=False):
+        return ThreadedWorker(scheduler=scheduler, worker_processes=worker_processes, assistant=assistant)
@@ -0,0 +1,42 @@
+# Copyright 2019 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+import os
+
+import luigi
+from pytest import fixture
+
+pids_by_task = {}
+
+
+class RecordPidTask(luigi.Task):
+    name = luigi.Parameter()
+
+    def run(self):
+        pids_by_task[self.name] = os.getpid()
+
+    def complete(self):
+        return self.name in pids_by_task
+
+
+@fixture
+def sut():
+    from servicecatalog_puppet.workflow import workers
+    return workers
+
+
+def test_threaded_worker_runs_tasks_in_this_process(sut):
+    # setup
+    pids_by_task.clear()
+    tasks_to_run = [RecordPidTask(name=f"task-{i}") for i in range(4)]
+
+    # exercise
+    actual_result = luigi.build(
+        tasks_to_run,
+        worker_scheduler_factory=sut.ThreadedWorkerSchedulerFactory(),
+        local_scheduler=True,
+        workers=2,
+    )
+
+    # verify
+    assert actual_result is True
+    assert pids_by_task == {f"task-{i}": os.getpid() for i in range(4)}
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# Copyright 2019 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+# Compares loading an expanded manifest from yaml and from its json sidecar:
+#   PYTHONPATH=. python testing/benchmark_manifest_io.py --accounts 5000 --launches 200
+import argparse
+import io
+import os
+import tempfile
+import time
+
+import yaml
+
+from servicecatalog_puppet import manifest_utils
+
+
+def generate_manifest(number_of_accounts, number_of_launches):
+    return {
+        'schema': 'puppet-2019-04-01',
+        'accounts': [
+            {
+                'account_id': f"{i:012d}",
+                'name': f"account-{i}",
+                'default_region': 'eu-west-1',
+                'regions_enabled': ['eu-west-1', 'eu-west-2'],
+                'tags': [f"team:{i % 20}", 'type:prod'],
+                'expanded_from': 'ou-abcd-12345678',
+                'organization': 'o-abcdefghij',
+            } for i in range(number_of_accounts)
+        ],
+        'launches': {
+            f"launch-{i}": {
+                'portfolio': 'central-it-team-portfolio',
+                'product': f"product-{i}",
+                'version': 'v1',
+                'parameters': {'RoleName': {'default': f"role-{i}"}},
+                'deploy_to': {'tags': [{'tag': f"team:{i % 20}", 'regions': 'enabled'}]},
+            } for i in range(number_of_launches)
+        },
+    }
+
+
+def time_it(name, function):
+    start = time.time()
+    function()
+    print(f"{name}: {time.time() - start:.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--accounts', type=int, default=5000)
+    parser.add_argument('--launches', type=int, default=200)
+    args = parser.parse_args()
+
+    manifest = generate_manifest(args.accounts, args.launches)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'manifest-expanded.yaml')
+        content = manifest_utils.dump_yaml(manifest)
+        with open(path, 'w') as f:
+            f.write(content)
+        print(f"manifest size: {len(content) / 1024 / 1024:.1f}MB, using libyaml: {yaml.__with_libyaml__}")
+
+        time_it('dump with yaml.safe_dump', lambda: yaml.safe_dump(manifest, default_flow_style=False))
+        time_it('dump with manifest_utils.dump_yaml', lambda: manifest_utils.dump_yaml(manifest))
+        time_it('load with yaml.safe_load', lambda: yaml.safe_load(io.StringIO(content)))
+        time_it('load with manifest_utils.load_yaml', lambda: manifest_utils.load_yaml(content))
+
+        time_it('write the json sidecar', lambda: manifest_utils.save_sidecar(path, content, manifest))
+
+        def load_from_sidecar():
+            with open(path, 'r') as f:
+                assert manifest_utils.load(f) == manifest
+
+        time_it('load with the json sidecar', load_from_sidecar)
+
+
+if __name__ == "__main__":
+    main()